@@ -1,18 +1,5 @@
 import streamlit as st
 import os
-from dotenv import load_dotenv
-from code_analyzer import CodeAnalyzer
-from utils import (
-    SUPPORTED_LANGUAGES, SAMPLE_CODES, detect_language, 
-    validate_code, get_code_stats
-)
-from prompts import (
-    get_code_explanation_prompt, get_specific_question_prompt,
-    get_debugging_prompt, get_optimization_prompt, get_comparison_prompt
-)
-
-# Load environment variables
-load_dotenv()
 
 # Page Configuration
 st.set_page_config(
@@ -69,11 +56,326 @@ st.markdown("""
     </div>
     """, unsafe_allow_html=True)
 
+# Project modules are imported after the static shell has been sent, so the
+# page paints before they load (the Gemini SDK itself is loaded on first analysis)
+import re
+import uuid
+import hashlib
+import json
+import time
+import asyncio
+from cache import ResponseCache
+from client_pool import AnalyzerPool
+from code_analyzer import DEFAULT_GENERATION_CONFIG, describe_failure
+from rate_limiter import RequestScheduler
+from retry import RetryError
+from async_analyzer import AsyncCodeAnalyzer
+from chunking import CHUNKABLE_MODES, analyze_chunked
+from incremental import INCREMENTAL_MODES, analyze_incremental
+from diffing import build_comparison_prompt, diff_stats
+from context_cache import ContextCacheManager
+from chat import ChatSession, chat_key
+from token_accounting import UsageRecorder, output_budget, preflight
+from telemetry import REGISTRY, start_http_server
+from history import HistoryStore
+from coalescing import RequestCoalescer
+from router import ModelRouter, stream_routed
+from near_duplicates import NEAR_DUPLICATE_MODES, NearDuplicateIndex
+from minify import MINIFY_POLICIES, minify_code, remap_line_references
+from jobs import CANCELLED, DONE, FAILED, QUEUED, Job, JobLimitError, JobManager, stream_to_job
+from utils import (
+    SUPPORTED_LANGUAGES, SAMPLE_CODES, detect_language, 
+    validate_code, get_code_stats, MAX_CODE_CHARS, MAX_CHUNKED_CODE_CHARS
+)
+from prompts import (
+    get_code_explanation_prompt, get_specific_question_prompt,
+    get_debugging_prompt, get_optimization_prompt
+)
+
+@st.cache_resource(show_spinner=False)
+def load_environment() -> None:
+    """
+    Read .env once per process instead of on every rerun.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+load_environment()
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """
+    Process-wide response cache shared by all sessions.
+    Set RESPONSE_CACHE_PATH to add an SQLite tier shared across worker processes.
+    """
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+        disk_path=os.getenv("RESPONSE_CACHE_PATH") or None
+    )
+
+@st.cache_resource
+def get_request_scheduler() -> RequestScheduler:
+    """
+    Process-wide rate limiter; budgets are per API key.
+    """
+    return RequestScheduler(
+        requests_per_minute=int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15")),
+        tokens_per_minute=int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+    )
+
+@st.cache_resource
+def get_context_cache() -> ContextCacheManager:
+    """
+    Gemini context caches for snippets that get follow-up questions.
+    """
+    return ContextCacheManager(ttl_seconds=float(os.getenv("CONTEXT_CACHE_TTL", "600")))
+
+@st.cache_resource
+def get_usage_recorder() -> UsageRecorder:
+    """
+    Actual token usage reported by the API, for capacity planning.
+    """
+    return UsageRecorder()
+
+@st.cache_resource
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    """
+    Cached analyses indexed by snippet similarity, so near-identical snippets reuse them.
+    Sized like the in-memory response cache by default; raise NEAR_DUPLICATE_MAX_ENTRIES
+    when RESPONSE_CACHE_PATH keeps more analyses on disk.
+    """
+    return NearDuplicateIndex(
+        threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")),
+        max_entries=int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")))
+    )
+
+@st.cache_resource
+def get_analyzer_pool() -> AnalyzerPool:
+    """
+    Process-wide pool of analyzers, reused across reruns and sessions.
+    """
+    return AnalyzerPool(
+        cache=get_response_cache(),
+        scheduler=get_request_scheduler(),
+        usage_recorder=get_usage_recorder(),
+        # Identical requests in flight at the same time share one API call
+        coalescer=RequestCoalescer(),
+        near_duplicates=get_near_duplicate_index()
+    )
+
+def get_analyzer(api_key: str, max_output_tokens: int, model_name: str):
+    """
+    Pooled analyzer for a model, with an output budget that fits the mode.
+    """
+    config = {**DEFAULT_GENERATION_CONFIG, "max_output_tokens": max_output_tokens}
+    return get_analyzer_pool().get(api_key, model_name=model_name, generation_config=config)
+
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    """
+    Model tier routing and per-model health, configured in config.toml [router].
+    """
+    return ModelRouter()
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """
+    Background workers for analyses, so results survive reruns and reloads.
+    """
+    return JobManager(
+        max_workers=int(os.getenv("JOB_WORKERS", "8")),
+        max_active_per_owner=int(os.getenv("JOB_MAX_PER_USER", "2"))
+    )
+
+@st.cache_resource
+def get_metrics_server():
+    """
+    Prometheus /metrics endpoint on METRICS_PORT, started once per process.
+    """
+    port = os.getenv("METRICS_PORT")
+    return start_http_server(int(port)) if port else None
+
+get_metrics_server()
+
+def export_metrics() -> None:
+    """
+    Write the metrics text file if METRICS_FILE is set (textfile collector).
+    """
+    path = os.getenv("METRICS_FILE")
+    if path:
+        try:
+            REGISTRY.write(path)
+        except OSError:
+            pass
+
+def show_admin_panel() -> None:
+    """
+    Latency, cache, retry and token figures for operators (SHOW_ADMIN_PANEL=1).
+    """
+    with st.expander("📈 Admin: Metrics"):
+        st.markdown("**Latency by mode (s)**")
+        st.dataframe(REGISTRY.histogram_summary("request_seconds"), hide_index=True)
+        st.markdown("**Latency by stage (s)**")
+        st.dataframe(REGISTRY.histogram_summary("stage_seconds"), hide_index=True)
+        st.markdown("**Time to first token (s)**")
+        st.dataframe(REGISTRY.histogram_summary("time_to_first_token_seconds"), hide_index=True)
+        st.markdown("**Response cache**")
+        st.json(get_response_cache().stats())
+        st.markdown("**Near-duplicate index**")
+        st.json(get_near_duplicate_index().stats())
+        st.markdown("**Background jobs**")
+        st.json(get_job_manager().stats())
+        retries = {dict(labels)["kind"]: value for labels, value in REGISTRY.counter_values("retries_total").items()}
+        failures = {
+            dict(labels)["kind"]: value for labels, value in REGISTRY.counter_values("request_failures_total").items()
+        }
+        st.markdown("**Retries / failures by error kind**")
+        st.json({"retries": retries, "failures": failures})
+        st.markdown("**Models (first-token latency, s)**")
+        st.dataframe(get_model_router().summary(), hide_index=True)
+        st.markdown("**Token usage**")
+        st.dataframe(get_usage_recorder().summary(), hide_index=True)
+        st.download_button("Download metrics (.prom)", REGISTRY.render(), file_name="metrics.prom")
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    """
+    Compressed on-disk history shared by all sessions.
+    """
+    return HistoryStore(
+        os.getenv("HISTORY_PATH", os.path.join(".data", "history.sqlite3")),
+        max_entries_per_session=int(os.getenv("HISTORY_MAX_ENTRIES", "50"))
+    )
+
+# Derived values are memoized by snippet content, so reruns triggered by other
+# widgets (sidebar, mode, detail level) do not recompute them
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def cached_language(code: str) -> str:
+    return detect_language(code)
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def cached_stats(code: str, language: str) -> dict:
+    return get_code_stats(code, language)
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def cached_minified(code: str, language: str, mode: str) -> dict:
+    """
+    The snippet as sent for a mode, with its line map back to the original.
+    """
+    return minify_code(code, language, mode)
+
+@st.cache_data(max_entries=128, ttl=3600, show_spinner=False)
+def build_prompt(
+    mode: str,
+    code: str,
+    language: str,
+    detail_level: str = "Medium",
+    question: str = "",
+    error: str = "",
+    code2: str = ""
+) -> str:
+    """
+    Prompt for a single-request mode, with the snippet minified for the mode.
+    """
+    if mode in MINIFY_POLICIES and len(code.strip()) <= MAX_CODE_CHARS:
+        code = cached_minified(code, language, mode)['code']
+    if mode == "Explain Code":
+        return get_code_explanation_prompt(code, language, detail_level)
+    elif mode == "Ask Question":
+        return get_specific_question_prompt(code, language, question)
+    elif mode == "Debug Code":
+        return get_debugging_prompt(code, language, error)
+    elif mode == "Optimize Code":
+        return get_optimization_prompt(code, language)
+    elif mode == "Compare Code":
+        # Near-identical versions are sent as one version plus a diff
+        return build_comparison_prompt(code, code2, language)
+    raise ValueError(f"No single prompt for mode: {mode}")
+
+@st.cache_data(max_entries=32, ttl=3600, show_spinner=False)
+def cached_diff_stats(code1: str, code2: str) -> dict:
+    return diff_stats(code1, code2)
+
+# History entries shown in the sidebar (and kept in session state)
+HISTORY_SIDEBAR_ENTRIES = 5
+
+# Conversations kept per browser session (one per snippet)
+MAX_CHATS_PER_SESSION = 5
+
+# How often a script run waiting on a job re-renders (and notices reruns)
+JOB_POLL_SECONDS = 0.5
+
+def render_job(placeholder, snapshot: dict) -> None:
+    """
+    Show a running job: streamed text so far, progress of multi-part work, or its queue state.
+    """
+    if snapshot['text']:
+        placeholder.markdown(snapshot['text'] + "▌")
+    elif snapshot['progress']:
+        done, total, label = snapshot['progress']
+        placeholder.progress(done / total if total else 0.0, text=label)
+    elif snapshot['wait_state']:
+        position, eta = snapshot['wait_state']
+        placeholder.info(f"⏳ Queued (position {position}, about {eta:.0f}s)...")
+    elif snapshot['status'] == QUEUED:
+        placeholder.info("⏳ Waiting for a free worker...")
+    else:
+        placeholder.info("🤖 AI is thinking... Please wait.")
+
+def follow_job(job: Job) -> None:
+    """
+    Render the job until it finishes, then take its result. A rerun only stops
+    this loop; the job keeps running and the next run picks it up again.
+    """
+    controls = st.empty()
+    if controls.button("⏹ Cancel analysis", key=f"cancel_{job.id}"):
+        get_job_manager().cancel(job.id, st.session_state.session_id)
+    placeholder = st.empty()
+    version = -1
+    while not job.done:
+        version = job.wait(version, JOB_POLL_SECONDS)
+        render_job(placeholder, job.snapshot())
+    controls.empty()
+    placeholder.empty()
+
+    if job.status == DONE:
+        st.session_state.analysis_result = job.result
+        entry = job.meta.get('history_entry')
+        if entry is not None and all(item['id'] != entry['id'] for item in st.session_state.history):
+            st.session_state.history = (st.session_state.history + [entry])[-HISTORY_SIDEBAR_ENTRIES:]
+    elif job.status == FAILED:
+        st.error(f"Analysis failed: {job.error}")
+    elif job.status == CANCELLED:
+        st.warning("Analysis cancelled.")
+    for note in job.notes:
+        st.caption(note)
+    st.session_state.active_job = ""
+    if st.query_params.get("job") == job.id:
+        del st.query_params["job"]
+
 # Initialize Session State
 if 'analysis_result' not in st.session_state:
     st.session_state.analysis_result = ""
+if 'session_id' not in st.session_state:
+    # Kept in the URL so history survives page reloads and server restarts. Whoever has
+    # the URL has the session (history and jobs); see "Session Links" in the README
+    sid = st.query_params.get("sid", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", sid):
+        sid = uuid.uuid4().hex
+        st.query_params["sid"] = sid
+    st.session_state.session_id = sid
 if 'history' not in st.session_state:
-    st.session_state.history = []
+    # Compact entries only; full results stay on disk until loaded
+    st.session_state.history = get_history_store().entries(
+        st.session_state.session_id, limit=HISTORY_SIDEBAR_ENTRIES
+    )
+if 'chats' not in st.session_state:
+    st.session_state.chats = {}
+if 'active_job' not in st.session_state:
+    # A reloaded page picks up the analysis it was showing
+    job_id = st.query_params.get("job", "")
+    st.session_state.active_job = job_id if re.fullmatch(r"[0-9a-f]{32}", job_id) else ""
 
 # Sidebar Configuration
 with st.sidebar:
@@ -100,7 +402,7 @@ with st.sidebar:
     # Analysis Mode
     mode = st.selectbox(
         "Analysis Mode",
-        ["Explain Code", "Ask Question", "Debug Code", "Optimize Code", "Compare Code"]
+        ["Explain Code", "Ask Question", "Debug Code", "Optimize Code", "Compare Code", "Full Review"]
     )
     
     # Language Selection
@@ -108,7 +410,7 @@ with st.sidebar:
     
     # Detail Level (for Explain mode)
     detail_level = "Medium"
-    if mode == "Explain Code":
+    if mode in ("Explain Code", "Full Review"):
         detail_level = st.select_slider(
             "Explanation Detail Level",
             options=["Basic", "Medium", "Advanced"],
@@ -121,18 +423,39 @@ with st.sidebar:
     # if sample_key != "None":
     #     st.info(f"Loading {sample_key}...")
     
+    # Analyses still running for this session (e.g. started in another tab)
+    running = [
+        job for job in get_job_manager().jobs_for(st.session_state.session_id)
+        if not job.done and job.id != st.session_state.active_job
+    ]
+    if running:
+        st.divider()
+        st.markdown("### ⏳ Running")
+        for job in running:
+            if st.button(f"Show {job.meta['mode']} - {job.meta['lang']}", key=f"job_{job.id}"):
+                st.session_state.active_job = job.id
+                st.rerun()
+
     st.divider()
     st.markdown("### 📜 History")
     
     if not st.session_state.history:
         st.caption("No analysis yet.")
     else:
-        for i, item in enumerate(reversed(st.session_state.history[-5:])): # Show last 5
+        for item in reversed(st.session_state.history):
             with st.expander(f"{item['mode']} - {item['lang']}"):
-                st.caption(item['result'][:150] + "...")
-                if st.button("Load", key=f"hist_{i}"):
-                    st.session_state.analysis_result = item['full_result']
-                    st.rerun()
+                st.caption(item['preview'])
+                if st.button("Load", key=f"hist_{item['id']}"):
+                    result = get_history_store().load(st.session_state.session_id, item['id'])
+                    if result is None:
+                        st.warning("This result is no longer stored.")
+                    else:
+                        st.session_state.analysis_result = result
+                        st.rerun()
+
+    if os.getenv("SHOW_ADMIN_PANEL", "").lower() in ("1", "true", "yes"):
+        st.divider()
+        show_admin_panel()
 
     st.divider()
     st.markdown("### 🛠️ How to use")
@@ -161,7 +484,9 @@ with col1:
     additional_input = {}
     if mode == "Ask Question":
         additional_input['question'] = st.text_input("What is your question about this code?", placeholder="How does the recursion work?")
-    elif mode == "Debug Code":
+        if st.session_state.chats and st.button("🔄 Start a new conversation"):
+            st.session_state.chats = {}
+    elif mode in ("Debug Code", "Full Review"):
         additional_input['error'] = st.text_input("Error message or symptoms (optional):", placeholder="Recursion depth exceeded...")
     elif mode == "Compare Code":
         st.subheader("📝 Second Code Snippet")
@@ -173,18 +498,31 @@ with col1:
         )
         additional_input['code2'] = code_snippet_2
 
+    incremental = mode in INCREMENTAL_MODES and st.checkbox(
+        "♻️ Incremental: re-analyze only changed functions",
+        help="Analyzes each function or class separately and reuses earlier results for unchanged ones. "
+             "Best when editing and re-analyzing the same file."
+    )
+
+    reuse_similar = mode in NEAR_DUPLICATE_MODES and st.checkbox(
+        "🔁 Reuse analyses of near-identical snippets",
+        value=True,
+        help="Shows a stored analysis when the code differs from an earlier snippet only in names, "
+             "literals, comments or whitespace. Untick to always get a fresh analysis."
+    )
+
     # Stats Display
-    # if code_snippet:
-    #     stats = get_code_stats(code_snippet)
-    #     detected_lang = detect_language(code_snippet) if selected_lang == "Auto-detect" else selected_lang
-        
-    #     st.divider()
-    #     st.subheader("📊 Code Insights")
-    #     m1, m2, m3, m4 = st.columns(4)
-    #     m1.metric("Lines", stats['lines'])
-    #     m2.metric("Functions", stats['functions'])
-    #     m3.metric("Complexity", stats['complexity'])
-    #     m4.metric("Language", detected_lang)
+    if code_snippet.strip():
+        detected_lang = cached_language(code_snippet) if selected_lang == "Auto-detect" else selected_lang
+        stats = cached_stats(code_snippet, detected_lang)
+
+        st.divider()
+        st.subheader("📊 Code Insights")
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Lines", stats['lines'])
+        m2.metric("Functions", stats['functions'])
+        m3.metric("Complexity", stats['complexity'])
+        m4.metric("Language", detected_lang)
     
     # Analyze Button
     analyze_btn = st.button("🚀 Analyze Code", use_container_width=True, type="primary")
@@ -194,7 +532,9 @@ with col2:
     
     if analyze_btn:
         # Validations
-        is_valid, error = validate_code(code_snippet)
+        # Large inputs go through the chunked pipeline in modes that support it
+        max_chars = MAX_CHUNKED_CODE_CHARS if mode in CHUNKABLE_MODES else MAX_CODE_CHARS
+        is_valid, error = validate_code(code_snippet, max_chars=max_chars)
         if not is_valid:
             st.error(error)
         elif mode == "Compare Code" and not code_snippet_2:
@@ -205,37 +545,244 @@ with col2:
             st.error("🔑 Google API Key is required. Please provide it in the sidebar.")
         else:
             try:
-                analyzer = CodeAnalyzer(api_key=api_key)
+                request_started = time.perf_counter()
                 
                 # Determine Language
-                final_lang = detect_language(code_snippet) if selected_lang == "Auto-detect" else selected_lang
+                with REGISTRY.span("detect_language"):
+                    final_lang = cached_language(code_snippet) if selected_lang == "Auto-detect" else selected_lang
+
+                # Pick a model: small, simple snippets go to the fast tier; the
+                # fallback is used when the primary is slow or rate limited
+                router = get_model_router()
+                route = router.choose(
+                    mode, detail_level, len(code_snippet), cached_stats(code_snippet, final_lang)['complexity'],
+                    api_key=api_key
+                )
+                analyzer = get_analyzer(api_key, output_budget(mode, detail_level), route[0])
+                st.caption(f"🧠 Model: {route[0]}")
                 
                 # Construct Prompt
-                if mode == "Explain Code":
-                    prompt = get_code_explanation_prompt(code_snippet, final_lang, detail_level)
-                elif mode == "Ask Question":
-                    prompt = get_specific_question_prompt(code_snippet, final_lang, additional_input['question'])
-                elif mode == "Debug Code":
-                    prompt = get_debugging_prompt(code_snippet, final_lang, additional_input.get('error', ""))
-                elif mode == "Optimize Code":
-                    prompt = get_optimization_prompt(code_snippet, final_lang)
-                elif mode == "Compare Code":
-                    prompt = get_comparison_prompt(code_snippet, additional_input['code2'], final_lang)
+                with REGISTRY.span("build_prompt", mode=mode):
+                    error_text = additional_input.get('error', "")
+                    if mode == "Full Review":
+                        prompts = {
+                            "Explanation": build_prompt("Explain Code", code_snippet, final_lang, detail_level),
+                            "Debugging": build_prompt("Debug Code", code_snippet, final_lang, error=error_text),
+                            "Optimization": build_prompt("Optimize Code", code_snippet, final_lang),
+                        }
+                        # Each part saw the snippet minified for its own mode
+                        line_maps = {
+                            label: cached_minified(code_snippet, final_lang, part_mode)['line_map']
+                            if len(code_snippet.strip()) <= MAX_CODE_CHARS else []
+                            for label, part_mode in (
+                                ("Explanation", "Explain Code"), ("Debugging", "Debug Code"),
+                                ("Optimization", "Optimize Code")
+                            )
+                        }
+                    else:
+                        prompt = build_prompt(
+                            mode, code_snippet, final_lang, detail_level,
+                            question=additional_input.get('question', ""),
+                            error=error_text,
+                            code2=additional_input.get('code2', "")
+                        )
                 
-                # Run Analysis
-                with st.spinner("🤖 AI is thinking... Please wait."):
-                    result = analyzer.analyze_with_retry(prompt)
+                if mode == "Compare Code":
+                    diff = cached_diff_stats(code_snippet, additional_input['code2'])
+                    st.caption(
+                        f"🔀 +{diff['added']} / −{diff['removed']} lines in {diff['hunks']} hunk(s) · "
+                        f"{diff['similarity']:.0%} similar"
+                    )
+                    if diff['diff']:
+                        with st.expander("Show diff"):
+                            st.code(diff['diff'], language="diff")
+
+                # The snippet as the single-request prompt carries it; answers refer
+                # to its lines, so they are mapped back to the original afterwards
+                minified = None
+                if mode in MINIFY_POLICIES and len(code_snippet.strip()) <= MAX_CODE_CHARS:
+                    minified = cached_minified(code_snippet, final_lang, mode)
+                line_map = minified['line_map'] if minified else []
+
+                if mode != "Full Review" and not incremental and len(code_snippet.strip()) <= MAX_CODE_CHARS:
+                    estimate = preflight(prompt, mode, detail_level)
+                    saved = minified['saved_tokens'] if minified else 0
+                    st.caption(
+                        f"≈ {estimate['input_tokens']:,} input tokens"
+                        + (f" ({saved:,} saved by minifying the code)" if saved else "")
+                        + f" · up to {estimate['output_budget']:,} output tokens"
+                    )
+
+                # Mode-specific input for the per-part prompts
+                if mode == "Ask Question":
+                    extra = f"QUESTION: {additional_input['question']}"
+                elif mode == "Debug Code" and additional_input.get('error'):
+                    extra = f"ERROR MESSAGE/SYMPTOM: {additional_input['error']}"
+                else:
+                    extra = ""
+
+                # Same code up to names, literals and comments as an earlier snippet:
+                # reuse its stored analysis instead of calling the API
+                similar = None
+                similar_scope = f"{mode}|{detail_level}|{extra}"
+                if (
+                    reuse_similar and not incremental and len(code_snippet.strip()) <= MAX_CODE_CHARS
+                    and analyzer.cached_result(prompt) is None
+                ):
+                    similar = analyzer.similar_result(code_snippet, final_lang, similar_scope)
+
+                # The analysis runs as a background job; everything it needs is
+                # resolved here, in the script thread
+                session_id = st.session_state.session_id
+                history_store = get_history_store()
+
+                if incremental:
+                    # Per-function analysis; unchanged sections come from the cache
+                    chunk_analyzer = get_analyzer(api_key, output_budget("Chunk Notes"), route[0])
+                    def work(job: Job) -> str:
+                        job.set_progress(0, 1, "🤖 Checking for changed functions...")
+                        try:
+                            result, reused, total = analyze_incremental(
+                                chunk_analyzer, code_snippet, final_lang, mode,
+                                detail_level=detail_level, extra=extra,
+                                session_id=session_id,
+                                on_progress=lambda done, total: job.set_progress(
+                                    done, total, f"🤖 Re-analyzed {done} of {total} changed sections..."
+                                )
+                            )
+                        except RetryError as e:
+                            # The job fails with a readable message; nothing goes to history
+                            raise RuntimeError(describe_failure(e)) from e
+                        job.note(f"♻️ Reused {reused} of {total} sections; re-analyzed {total - reused}.")
+                        return result
+                elif len(code_snippet.strip()) > MAX_CODE_CHARS:
+                    # Too large for one request: analyze chunks in parallel, then merge
+                    chunk_analyzer = get_analyzer(api_key, output_budget("Chunk Notes"), route[0])
+                    def work(job: Job) -> str:
+                        job.set_progress(0, 1, "🤖 Analyzing large file in parts...")
+                        try:
+                            return analyze_chunked(
+                                chunk_analyzer, code_snippet, final_lang, mode,
+                                detail_level=detail_level, extra=extra,
+                                session_id=session_id,
+                                on_progress=lambda done, total: job.set_progress(
+                                    done, total, f"🤖 Analyzed {done} of {total} parts..."
+                                ),
+                                merge_analyzer=analyzer
+                            )
+                        except RetryError as e:
+                            # The job fails with a readable message; nothing goes to history
+                            raise RuntimeError(describe_failure(e)) from e
+                elif mode == "Full Review":
+                    # Run all three analyses concurrently; each part is shown as it finishes
+                    def work(job: Job) -> str:
+                        async_analyzer = AsyncCodeAnalyzer(analyzer)
+
+                        async def run_full_review() -> dict:
+                            results = {}
+                            async for label, text in async_analyzer.analyze_many(prompts, session_id=session_id):
+                                results[label] = remap_line_references(text, line_maps[label])
+                                job.append(f"# {label}\n\n{results[label]}\n\n")
+                            return results
+
+                        try:
+                            results = asyncio.run(run_full_review())
+                        finally:
+                            # Cancelling the job stops here; drop queued calls
+                            async_analyzer.cancel()
+                        return "\n\n".join(f"# {label}\n\n{results[label]}" for label in prompts)
+                elif mode == "Ask Question":
+                    # Follow-up questions on the same snippet continue one conversation,
+                    # kept in session state so reruns do not rebuild it
+                    chats = st.session_state.chats
+                    key = chat_key(code_snippet, final_lang)
+                    if key not in chats:
+                        chats[key] = ChatSession(minified['code'] if minified else code_snippet, final_lang)
+                        while len(chats) > MAX_CHATS_PER_SESSION:
+                            chats.pop(next(iter(chats)))
+                    chat = chats[key]
+                    context_cache = get_context_cache()
+                    question = additional_input['question']
+                    def work(job: Job) -> str:
+                        if minified:
+                            REGISTRY.inc("prompt_tokens_saved_total", minified['saved_tokens'], mode=mode)
+                        answer = stream_to_job(job, chat.ask(
+                            analyzer,
+                            question,
+                            context_cache=context_cache,
+                            session_id=session_id,
+                            on_wait=job.notify_wait
+                        ))
+                        return remap_line_references(answer, line_map)
+                elif similar is None:
+                    # Stream the analysis, failing over to the route's fallback model
+                    analyzers = {
+                        model: get_analyzer(api_key, output_budget(mode, detail_level), model) for model in route
+                    }
+                    def work(job: Job) -> str:
+                        if minified:
+                            REGISTRY.inc("prompt_tokens_saved_total", minified['saved_tokens'], mode=mode)
+                        result = stream_to_job(job, stream_routed(
+                            router,
+                            analyzers.__getitem__,
+                            route,
+                            prompt,
+                            session_id=session_id,
+                            on_wait=job.notify_wait
+                        ))
+                        if reuse_similar:
+                            analyzer.remember_similar(code_snippet, final_lang, similar_scope, prompt)
+                        return remap_line_references(result, line_map)
+
+                if similar is not None:
+                    # Not remapped: its line numbers belong to the other snippet, whose
+                    # comments and blank lines may differ from this one
+                    result = similar['result']
+                    st.info(
+                        f"🔁 Showing the stored analysis of a {similar['similarity']:.0%} similar snippet; "
+                        "line numbers in it may not match your code. "
+                        "Untick “Reuse analyses of near-identical snippets” for a fresh one."
+                    )
+                    REGISTRY.observe("request_seconds", time.perf_counter() - request_started, mode=mode)
+                    export_metrics()
                     st.session_state.analysis_result = result
-                    st.session_state.history.append({
-                        "mode": mode,
-                        "lang": final_lang,
-                        "result": result,
-                        "full_result": result
-                    })
+                    entry = history_store.add(session_id, mode, final_lang, result)
+                    st.session_state.history = (st.session_state.history + [entry])[-HISTORY_SIDEBAR_ENTRIES:]
+                else:
+                    def run(job: Job) -> str:
+                        result = work(job)
+                        REGISTRY.observe("request_seconds", time.perf_counter() - request_started, mode=mode)
+                        export_metrics()
+                        # Stored even if nobody is watching any more
+                        job.meta['history_entry'] = history_store.add(session_id, mode, final_lang, result)
+                        return result
+
+                    # Resubmitting the same request while it runs reattaches to it
+                    request_key = hashlib.sha256(json.dumps(
+                        [mode, final_lang, detail_level, incremental, code_snippet, additional_input], sort_keys=True
+                    ).encode("utf-8")).hexdigest()
+                    job = get_job_manager().submit(
+                        session_id, request_key, run, meta={"mode": mode, "lang": final_lang}
+                    )
+                    st.session_state.active_job = job.id
+                    st.query_params["job"] = job.id
                 
+            except JobLimitError as e:
+                st.error(f"⏳ {str(e)}")
             except Exception as e:
                 st.error(f"Initialization Error: {str(e)}")
 
+    # Follow the running analysis, if any (also after a rerun or page reload)
+    if st.session_state.active_job:
+        active_job = get_job_manager().get(st.session_state.active_job, st.session_state.session_id)
+        if active_job is None:
+            # Finished and pruned, or started by another session
+            st.session_state.active_job = ""
+            if "job" in st.query_params:
+                del st.query_params["job"]
+        else:
+            follow_job(active_job)
+
     # Display Result
     if st.session_state.analysis_result:
         st.markdown(f'<div class="result-container">', unsafe_allow_html=True)
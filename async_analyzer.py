@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from code_analyzer import CodeAnalyzer
+
+DEFAULT_MAX_CONCURRENCY = 3
+
+# Shared by all sessions so the number of in-flight API calls per process stays bounded
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini")
+
+
+class AsyncCodeAnalyzer:
+    def __init__(
+        self,
+        analyzer: CodeAnalyzer,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        executor: Optional[ThreadPoolExecutor] = None,
+        raise_on_failure: bool = False
+    ):
+        """
+        asyncio front-end for CodeAnalyzer. Blocking SDK calls run on a thread pool,
+        so the cache, retry and rate limiting behaviour of the sync analyzer still applies.
+        Failed calls give a readable message as their result, or raise RetryError
+        when raise_on_failure is set.
+        """
+        self.analyzer = analyzer
+        self.max_concurrency = max_concurrency
+        self.executor = executor or _executor
+        self.raise_on_failure = raise_on_failure
+        self.cancelled = threading.Event()
+
+    async def analyze(self, prompt: str, session_id: Optional[str] = None) -> str:
+        """
+        Analyze one prompt without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        method = self.analyzer.generate_analysis if self.raise_on_failure else self.analyzer.analyze_with_retry
+        call = functools.partial(method, prompt, session_id=session_id)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def analyze_many(
+        self,
+        prompts: Dict[str, str],
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Analyze several labelled prompts concurrently, yielding (label, result) as each finishes.
+        At most max_concurrency calls run at once. Closing the iterator, or calling cancel(),
+        drops every call that has not started yet.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(label: str, prompt: str) -> Tuple[str, str]:
+            async with semaphore:
+                if self.cancelled.is_set():
+                    raise asyncio.CancelledError()
+                return label, await self.analyze(prompt, session_id)
+
+        tasks = [asyncio.ensure_future(run(label, prompt)) for label, prompt in prompts.items()]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel(self) -> None:
+        """
+        Stop starting new calls. Calls already sent to the API run to completion.
+        """
+        self.cancelled.set()
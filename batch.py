@@ -0,0 +1,235 @@
+"""
+Headless batch analysis of a source tree.
+
+Example:
+    python batch.py src/ --out reports/ --mode optimize --workers 4
+
+Completed files are recorded in <out>/manifest.jsonl, so re-running the same
+command after an interruption only analyzes what is left.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from cache import ResponseCache
+from code_analyzer import CodeAnalyzer
+from rate_limiter import RequestScheduler
+from prompts import get_code_explanation_prompt, get_debugging_prompt, get_optimization_prompt
+from chunking import analyze_chunked
+from utils import (
+    EXTENSION_LANGUAGES, MAX_CHUNKED_CODE_CHARS, MAX_CODE_CHARS,
+    detect_language, validate_code
+)
+
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", "build", "dist"}
+
+MODES = ("explain", "debug", "optimize")
+
+# CLI mode names mapped to the UI modes used by the chunked pipeline
+MODE_NAMES = {"explain": "Explain Code", "debug": "Debug Code", "optimize": "Optimize Code"}
+
+
+def build_prompt(mode: str, code: str, language: str, detail_level: str) -> str:
+    if mode == "explain":
+        return get_code_explanation_prompt(code, language, detail_level)
+    if mode == "debug":
+        return get_debugging_prompt(code, language)
+    return get_optimization_prompt(code, language)
+
+
+def iter_source_files(root: str, extensions: Set[str]) -> Iterator[str]:
+    """
+    Yield source files under root in a stable order, skipping VCS and dependency folders.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in extensions:
+                yield os.path.join(dirpath, filename)
+
+
+def job_hash(code: str, mode: str, detail_level: str) -> str:
+    return hashlib.sha256(f"{mode}\x00{detail_level}\x00{code}".encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path: str):
+        """
+        Append-only record of completed jobs, keyed by content hash.
+        """
+        self.path = path
+        self.done: Set[str] = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)["hash"])
+                    except (ValueError, KeyError):
+                        # A line cut short by an interrupted run
+                        continue
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.done
+
+    def record(self, entry: Dict[str, str]) -> None:
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.add(entry["hash"])
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        analyzer: CodeAnalyzer,
+        out_dir: str,
+        mode: str = "explain",
+        detail_level: str = "Medium",
+        workers: int = 4,
+        output_format: str = "both",
+        log: Callable[[str], None] = print
+    ):
+        """
+        Analyze files with a bounded worker pool, writing Markdown and/or JSONL results.
+        """
+        self.analyzer = analyzer
+        self.out_dir = out_dir
+        self.mode = mode
+        self.detail_level = detail_level
+        self.workers = workers
+        self.output_format = output_format
+        self.log = log
+        os.makedirs(out_dir, exist_ok=True)
+        self.manifest = Manifest(os.path.join(out_dir, "manifest.jsonl"))
+        self._results_lock = threading.Lock()
+
+    def run(self, root: str, files: List[str]) -> Dict[str, int]:
+        """
+        Analyze every file not already in the manifest. Returns counts per outcome.
+        """
+        counts = {"done": 0, "skipped": 0, "invalid": 0, "failed": 0}
+        pending = []
+        for path in files:
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    code = f.read()
+            except OSError as e:
+                # Deleted or unreadable since the walk; the rest of the batch still runs
+                counts["invalid"] += 1
+                self.log(f"skip  {path}: {e}")
+                continue
+            is_valid, error = validate_code(code, max_chars=MAX_CHUNKED_CODE_CHARS)
+            if not is_valid:
+                counts["invalid"] += 1
+                self.log(f"skip  {path}: {error}")
+                continue
+            digest = job_hash(code, self.mode, self.detail_level)
+            if digest in self.manifest:
+                counts["skipped"] += 1
+                continue
+            pending.append((path, code, digest))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self._analyze_file, root, path, code, digest): path
+                for path, code, digest in pending
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    future.result()
+                    counts["done"] += 1
+                    self.log(f"done  {path}")
+                except Exception as e:
+                    # One bad file must not abort the batch or lose the other results
+                    counts["failed"] += 1
+                    self.log(f"fail  {path}: {e}")
+        return counts
+
+    def _analyze_file(self, root: str, path: str, code: str, digest: str) -> None:
+        relpath = os.path.relpath(path, root)
+        language = detect_language(code, filename=path)
+        if len(code.strip()) > MAX_CODE_CHARS:
+            result = analyze_chunked(
+                self.analyzer, code, language, MODE_NAMES[self.mode],
+                detail_level=self.detail_level, session_id="batch"
+            )
+        else:
+            prompt = build_prompt(self.mode, code, language, self.detail_level)
+            result = self.analyzer.generate_analysis(prompt, session_id="batch")
+
+        if self.output_format in ("md", "both"):
+            report_path = os.path.join(self.out_dir, f"{relpath}.{self.mode}.md")
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(f"# {relpath} ({language}, {self.mode})\n\n{result}\n")
+        if self.output_format in ("jsonl", "both"):
+            record = {"path": relpath, "language": language, "mode": self.mode, "result": result}
+            with self._results_lock:
+                with open(os.path.join(self.out_dir, "results.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+        # Only recorded once the outputs are on disk, so an interrupted file is redone
+        self.manifest.record({"path": relpath, "hash": digest, "mode": self.mode})
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyze a source tree with Code Explainer AI.")
+    parser.add_argument("root", help="Directory (or single file) to analyze")
+    parser.add_argument("--out", default="reports", help="Output directory (default: reports)")
+    parser.add_argument("--mode", choices=MODES, default="explain")
+    parser.add_argument("--detail", choices=["Basic", "Medium", "Advanced"], default="Medium",
+                        help="Detail level for explain mode")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel API calls (default: 4)")
+    parser.add_argument("--format", dest="output_format", choices=["md", "jsonl", "both"], default="both")
+    parser.add_argument("--ext", default=",".join(sorted(EXTENSION_LANGUAGES)),
+                        help="Comma-separated file extensions to include")
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15")),
+                        help="Requests per minute budget")
+    parser.add_argument("--cache", default=os.getenv("RESPONSE_CACHE_PATH"),
+                        help="Optional SQLite response cache path")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    load_dotenv()
+    try:
+        analyzer = CodeAnalyzer(
+            cache=ResponseCache(disk_path=args.cache) if args.cache else None,
+            scheduler=RequestScheduler(requests_per_minute=args.rpm)
+        )
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    extensions = {e if e.startswith(".") else f".{e}" for e in args.ext.lower().split(",") if e}
+    if os.path.isfile(args.root):
+        root, files = os.path.dirname(os.path.abspath(args.root)), [args.root]
+    else:
+        root, files = args.root, list(iter_source_files(args.root, extensions))
+
+    runner = BatchRunner(
+        analyzer, args.out, mode=args.mode, detail_level=args.detail,
+        workers=args.workers, output_format=args.output_format
+    )
+    counts = runner.run(root, files)
+    print(
+        f"{counts['done']} analyzed, {counts['skipped']} already done, "
+        f"{counts['invalid']} invalid, {counts['failed']} failed"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Benchmark for utils.get_code_stats against the previous multi-pass regex version.
+
+Run from the repository root:
+    python benchmarks/bench_metrics.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import TARGET_CHARS, repeat_to  # noqa: E402
+from utils import SAMPLE_CODES, get_code_stats  # noqa: E402
+
+
+def legacy_code_stats(code: str) -> dict:
+    """
+    The original implementation: one splitlines pass plus eight regex passes.
+    """
+    score = 0
+    score += len(re.findall(r'\b(if|else|elif|switch|case)\b', code))
+    score += len(re.findall(r'\b(for|while|foreach|do)\b', code)) * 2
+    score += len(re.findall(r'\b(def|function|class|interface|async)\b', code)) * 3
+    score += len(re.findall(r'\b(try|catch|finally|throw|raise)\b', code)) * 2
+    patterns = [
+        r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)',
+        r'function\s+([a-zA-Z_][a-zA-Z0-9_]*)',
+        r'([a-zA-Z_][a-zA-Z0-9_]*)\s*\(.*?\)\s*\{',
+        r'([a-zA-Z_][a-zA-Z0-9_]*)::\s*function',
+    ]
+    functions = set()
+    for pattern in patterns:
+        functions.update(re.findall(pattern, code))
+    return {"lines": len(code.splitlines()), "chars": len(code), "score": score, "functions": len(functions)}
+
+
+def corpus() -> dict:
+    return {
+        "python (50k)": repeat_to(SAMPLE_CODES["Python - Bubble Sort"] + "\n\n", TARGET_CHARS),
+        "javascript (50k)": repeat_to(SAMPLE_CODES["JavaScript - Async Fetch"] + "\n\n", TARGET_CHARS),
+        # Minified-style input: a single very long line full of calls
+        "one long line (50k)": repeat_to("call(a, b(c)) + other(d) ", TARGET_CHARS),
+    }
+
+
+def bench(fn, code: str, number: int) -> float:
+    return min(timeit.repeat(lambda: fn(code), number=number, repeat=3)) / number * 1000
+
+
+def main() -> None:
+    print(f"{'input':<22}{'legacy (ms)':>14}{'single-pass (ms)':>18}{'speedup':>10}")
+    for name, code in corpus().items():
+        number = 1 if "long line" in name else 5
+        legacy = bench(legacy_code_stats, code, number)
+        current = bench(get_code_stats, code, number)
+        print(f"{name:<22}{legacy:>14.2f}{current:>18.2f}{legacy / current:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
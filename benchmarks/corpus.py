@@ -0,0 +1,84 @@
+"""
+Benchmark inputs: the bundled SAMPLE_CODES plus synthetic 50k-character files.
+"""
+import os
+import sys
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import SAMPLE_CODES  # noqa: E402
+
+TARGET_CHARS = 50000
+
+# name -> (language, code)
+Corpus = Dict[str, Tuple[str, str]]
+
+
+def repeat_to(text: str, size: int) -> str:
+    return (text * (size // len(text) + 1))[:size]
+
+
+def synthetic_python(size: int) -> str:
+    """
+    Many distinct small functions and classes, like a real module (no exact repeats).
+    """
+    parts = []
+    i = 0
+    while sum(len(p) for p in parts) < size:
+        parts.append(
+            f"def handler_{i}(items, limit={i % 7 + 1}):\n"
+            f"    # Filter and score batch {i}\n"
+            f"    total = 0\n"
+            f"    for item in items:\n"
+            f"        if item.value > limit:\n"
+            f"            total += item.value * {i % 5 + 2}\n"
+            f"        elif item.value < 0:\n"
+            f"            raise ValueError(\"negative value in batch {i}\")\n"
+            f"    return total\n\n\n"
+        )
+        if i % 10 == 9:
+            parts.append(
+                f"class Worker{i}:\n"
+                f"    def __init__(self, queue):\n"
+                f"        self.queue = queue\n\n"
+                f"    def run(self):\n"
+                f"        while self.queue:\n"
+                f"            handler_{i}(self.queue.pop())\n\n\n"
+            )
+        i += 1
+    return "".join(parts)[:size]
+
+
+def synthetic_javascript(size: int) -> str:
+    parts = []
+    i = 0
+    while sum(len(p) for p in parts) < size:
+        parts.append(
+            f"async function loadResource{i}(client, id) {{\n"
+            f"  try {{\n"
+            f"    const response = await client.get(`/api/v{i % 3 + 1}/items/${{id}}`);\n"
+            f"    if (!response.ok) {{\n"
+            f"      throw new Error('request {i} failed');\n"
+            f"    }}\n"
+            f"    return response.json();\n"
+            f"  }} catch (error) {{\n"
+            f"    console.error(error);\n"
+            f"    return null;\n"
+            f"  }}\n"
+            f"}}\n\n"
+        )
+        i += 1
+    return "".join(parts)[:size]
+
+
+def build_corpus(size: int = TARGET_CHARS) -> Corpus:
+    corpus: Corpus = {}
+    for name, code in SAMPLE_CODES.items():
+        corpus[name] = (name.split(" - ")[0], code)
+    corpus[f"synthetic python ({size // 1000}k)"] = ("Python", synthetic_python(size))
+    corpus[f"synthetic javascript ({size // 1000}k)"] = ("JavaScript", synthetic_javascript(size))
+    corpus[f"repeated sample ({size // 1000}k)"] = (
+        "Python", repeat_to(SAMPLE_CODES["Python - Bubble Sort"] + "\n\n", size)
+    )
+    return corpus
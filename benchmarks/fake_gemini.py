@@ -0,0 +1,108 @@
+"""
+Local stand-in for google.generativeai.GenerativeModel, for offline benchmarks.
+
+Simulates request latency, streaming chunk cadence, 429 rate limits and empty
+responses, so CodeAnalyzer can be driven end to end without network access.
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from token_accounting import estimate_tokens
+
+
+class FakeRateLimitError(Exception):
+    """
+    Shaped like google.api_core.exceptions.ResourceExhausted.
+    """
+    code = 429
+
+
+@dataclass
+class FakeProfile:
+    first_token_latency: float = 0.05   # seconds before the first chunk / the full response
+    chunk_interval: float = 0.01        # seconds between streamed chunks
+    chunks: int = 20
+    chunk_chars: int = 80
+    rate_limit_rate: float = 0.0        # probability that a call fails with 429
+    empty_rate: float = 0.0             # probability that a call returns no text
+    seed: int = 0
+
+
+@dataclass
+class FakeUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+    cached_content_token_count: int = 0
+
+
+@dataclass
+class FakeChunk:
+    text: str
+    usage_metadata: Optional[FakeUsage] = None
+
+
+class FakeChat:
+    def __init__(self, model: "FakeGenerativeModel", history: List[Dict[str, Any]]):
+        self.model = model
+        self.history = history
+
+    def send_message(self, message: str, stream: bool = False, request_options: Optional[Dict[str, Any]] = None):
+        prompt = "".join(part for turn in self.history for part in turn["parts"]) + message
+        return self.model.generate_content(prompt, stream=stream, request_options=request_options)
+
+
+class FakeGenerativeModel:
+    def __init__(self, profile: Optional[FakeProfile] = None):
+        self.profile = profile or FakeProfile()
+        self._random = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _roll(self) -> float:
+        with self._lock:
+            self.calls += 1
+            return self._random.random()
+
+    def _usage(self, prompt: str, text: str) -> FakeUsage:
+        prompt_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text) if text else 0
+        return FakeUsage(prompt_tokens, output_tokens, prompt_tokens + output_tokens)
+
+    def _chunk_texts(self) -> List[str]:
+        p = self.profile
+        return [f"{'x' * (p.chunk_chars - 8)} part{i:03d}" for i in range(p.chunks)]
+
+    def generate_content(
+        self,
+        prompt: str,
+        stream: bool = False,
+        request_options: Optional[Dict[str, Any]] = None
+    ):
+        p = self.profile
+        roll = self._roll()
+        time.sleep(p.first_token_latency)
+        if roll < p.rate_limit_rate:
+            raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        texts = [] if roll < p.rate_limit_rate + p.empty_rate else self._chunk_texts()
+
+        if not stream:
+            time.sleep(p.chunk_interval * max(0, len(texts) - 1))
+            text = "".join(texts)
+            return FakeChunk(text, self._usage(prompt, text))
+        return self._stream(prompt, texts)
+
+    def _stream(self, prompt: str, texts: List[str]) -> Iterator[FakeChunk]:
+        if not texts:
+            yield FakeChunk("", self._usage(prompt, ""))
+            return
+        for i, text in enumerate(texts):
+            if i:
+                time.sleep(self.profile.chunk_interval)
+            last = i == len(texts) - 1
+            yield FakeChunk(text, self._usage(prompt, "".join(texts)) if last else None)
+
+    def start_chat(self, history: Optional[List[Dict[str, Any]]] = None) -> FakeChat:
+        return FakeChat(self, history or [])
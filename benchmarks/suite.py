@@ -0,0 +1,282 @@
+"""
+Offline benchmark suite: utils metrics, language detection, prompt builders and
+CodeAnalyzer driven by a local Gemini stand-in (no network access needed).
+
+Run from the repository root:
+    python benchmarks/suite.py                          # print results
+    python benchmarks/suite.py --save baseline.json     # record a baseline
+    python benchmarks/suite.py --baseline baseline.json # compare against it
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+from benchmarks.corpus import build_corpus  # noqa: E402
+from benchmarks.fake_gemini import FakeGenerativeModel, FakeProfile  # noqa: E402
+from code_analyzer import CodeAnalyzer  # noqa: E402
+from minify import minify_code  # noqa: E402
+from near_duplicates import NUM_PERM, NearDuplicateIndex, minhash_signature  # noqa: E402
+from prompts import (  # noqa: E402
+    get_code_explanation_prompt, get_comparison_prompt, get_debugging_prompt,
+    get_optimization_prompt, get_specific_question_prompt
+)
+from retry import RetryPolicy  # noqa: E402
+
+# A result is a regression when it is this much worse than the baseline
+DEFAULT_TOLERANCE = 0.10
+
+# Simulated API: 50 ms to first token, 20 chunks 10 ms apart, 10% 429s, 5% empty
+API_PROFILE = FakeProfile(
+    first_token_latency=0.05, chunk_interval=0.01, chunks=20, rate_limit_rate=0.10, empty_rate=0.05, seed=42
+)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted sequence.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], wall: float, peak_bytes: Optional[int] = None) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "ops": len(values),
+        "throughput_ops_s": round(len(values) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "peak_kib": round(peak_bytes / 1024, 1) if peak_bytes is not None else None,
+    }
+
+
+def run_ops(ops: List[Callable[[], Any]], workers: int = 1) -> List[float]:
+    def timed(op: Callable[[], Any]) -> float:
+        started = time.perf_counter()
+        op()
+        return time.perf_counter() - started
+
+    if workers == 1:
+        return [timed(op) for op in ops]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(timed, ops))
+
+
+def measure(ops: List[Callable[[], Any]], workers: int = 1, trace_memory: bool = True) -> Dict[str, float]:
+    """
+    Time every op (wall clock and per op), then replay a sample under tracemalloc
+    for peak memory so tracing does not distort the timings.
+    """
+    started = time.perf_counter()
+    latencies = run_ops(ops, workers)
+    wall = time.perf_counter() - started
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        run_ops(ops[: max(1, len(ops) // 10)], workers)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return summarize(latencies, wall, peak)
+
+
+def offline_analyzer(profile: FakeProfile) -> CodeAnalyzer:
+    """
+    A real CodeAnalyzer whose model is the local stand-in; no cache, no scheduler.
+    The model name gives it its own circuit breaker.
+    """
+    analyzer = CodeAnalyzer(api_key="offline-benchmark", model_name="offline-fake")
+    analyzer.model = FakeGenerativeModel(profile)
+    return analyzer
+
+
+def fast_retry_policy() -> RetryPolicy:
+    # Same policy shape as production, with delays scaled to the simulated latency
+    return RetryPolicy(max_attempts=4, base_delay=0.02, max_delay=0.2, deadline=30)
+
+
+def bench_local(corpus: Dict[str, Any], rounds: int) -> Dict[str, Dict[str, float]]:
+    codes = [(language, code) for language, code in corpus.values()]
+
+    def detect(code: str) -> Callable[[], Any]:
+        def op():
+            utils._detection_cache.clear()  # measure the uncached path
+            return utils.detect_language(code)
+        return op
+
+    def prompts(language: str, code: str) -> Callable[[], Any]:
+        def op():
+            get_code_explanation_prompt(code, language, "Advanced")
+            get_specific_question_prompt(code, language, "What does this do?")
+            get_debugging_prompt(code, language, "IndexError: list index out of range")
+            get_optimization_prompt(code, language)
+            get_comparison_prompt(code, code, language)
+        return op
+
+    results = {}
+    for name, code_lang in corpus.items():
+        language, code = code_lang
+        results[f"get_code_stats / {name}"] = measure(
+            [lambda c=code, l=language: utils.get_code_stats(c, l)] * rounds
+        )
+    results["detect_language (uncached) / corpus"] = measure([detect(code) for _, code in codes] * rounds)
+    results["prompt builders / corpus"] = measure([prompts(language, code) for language, code in codes] * rounds)
+    results["minify_code (Debug) / corpus"] = measure(
+        [lambda c=code, l=language: minify_code(c, l, "Debug Code") for language, code in codes] * rounds
+    )
+    return results
+
+
+def bench_near_duplicates(corpus: Dict[str, Any], entries: int, rounds: int) -> Dict[str, Dict[str, float]]:
+    """
+    MinHash signatures of the corpus, and lookups in an index filled with random signatures.
+    """
+    def signature(language: str, code: str) -> Callable[[], Any]:
+        def op():
+            minhash_signature.cache_clear()  # measure the uncached path
+            return minhash_signature(code, language)
+        return op
+
+    rng = random.Random(7)
+    index = NearDuplicateIndex(max_entries=entries)
+    for i in range(entries):
+        index.add(array("I", (rng.getrandbits(32) for _ in range(NUM_PERM))), "bench", f"{i:064x}")
+    queries = [minhash_signature(code, language) for language, code in corpus.values()]
+
+    return {
+        "minhash_signature / corpus": measure(
+            [signature(language, code) for language, code in corpus.values()] * rounds
+        ),
+        f"near-duplicate lookup / {entries} entries": measure(
+            [lambda q=q: index.find(q, "bench") for q in queries if q is not None] * 200
+        ),
+    }
+
+
+def bench_analyzer(requests: int, workers: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    analyzer = offline_analyzer(API_PROFILE)
+    results["generate_analysis (fake API)"] = measure(
+        [
+            lambda i=i: analyzer.generate_analysis(f"prompt {i}", retry_policy=fast_retry_policy())
+            for i in range(requests)
+        ],
+        workers,
+        trace_memory=False
+    )
+
+    analyzer = offline_analyzer(API_PROFILE)
+    first_token: List[float] = []
+
+    def stream(i: int) -> Callable[[], Any]:
+        def op():
+            started = time.perf_counter()
+            for n, _ in enumerate(analyzer.stream_analysis(f"prompt {i}", retry_policy=fast_retry_policy())):
+                if n == 0:
+                    first_token.append(time.perf_counter() - started)
+        return op
+
+    started = time.perf_counter()
+    results["stream_analysis total (fake API)"] = measure(
+        [stream(i) for i in range(requests)], workers, trace_memory=False
+    )
+    results["stream_analysis first token (fake API)"] = summarize(
+        first_token, time.perf_counter() - started
+    )
+    return results
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Print a comparison table and return the names of regressed benchmarks.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<52}{'p95 base':>11}{'p95 now':>11}{'change':>9}{'ops/s change':>14}")
+    for name, now in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<52}{'(new)':>11}{now['p95_ms']:>11.2f}")
+            continue
+        p95_change = now["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        tput_change = now["throughput_ops_s"] / base["throughput_ops_s"] - 1 if base["throughput_ops_s"] else 0.0
+        regressed = p95_change > tolerance or tput_change < -tolerance
+        flag = "  REGRESSION" if regressed else ""
+        print(
+            f"{name:<52}{base['p95_ms']:>11.2f}{now['p95_ms']:>11.2f}"
+            f"{p95_change:>+9.1%}{tput_change:>+14.1%}{flag}"
+        )
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks for Code Explainer.")
+    parser.add_argument("--rounds", type=int, default=5, help="Repetitions per local benchmark input.")
+    parser.add_argument("--requests", type=int, default=60, help="Simulated API requests per analyzer benchmark.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent analyzer requests.")
+    parser.add_argument("--size", type=int, default=50000, help="Characters per synthetic corpus file.")
+    parser.add_argument("--index-entries", type=int, default=200000, help="Entries in the near-duplicate index.")
+    parser.add_argument("--only", choices=("local", "analyzer"), help="Run one group only.")
+    parser.add_argument("--save", metavar="PATH", help="Write results as a baseline JSON file.")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a saved baseline.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown (0.10 = 10%%).")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    if args.only in (None, "local"):
+        corpus = build_corpus(args.size)
+        results.update(bench_local(corpus, args.rounds))
+        results.update(bench_near_duplicates(corpus, args.index_entries, args.rounds))
+    if args.only in (None, "analyzer"):
+        results.update(bench_analyzer(args.requests, args.workers))
+
+    print(f"{'benchmark':<52}{'ops':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<52}{r['ops']:>6}{r['throughput_ops_s']:>10.1f}{r['p50_ms']:>10.2f}"
+            f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['peak_kib'] if r['peak_kib'] is not None else '-':>10}"
+        )
+
+    if args.save:
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "args": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from telemetry import REGISTRY
+
+# Defaults for the in-memory tier
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 60 * 60
+
+
+def make_cache_key(prompt: str, model_name: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build a content-addressed key from the prompt, model and generation config.
+    """
+    config = json.dumps(generation_config or {}, sort_keys=True, default=str)
+    digest = hashlib.sha256()
+    for part in (model_name, config, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        """
+        SQLite-backed tier that can be shared by several worker processes.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+        self.prune()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        value, created = row
+        if time.time() - created > self.ttl_seconds:
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, time.time())
+                )
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def prune(self) -> None:
+        """
+        Drop expired rows.
+        """
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,)
+                )
+        except sqlite3.Error:
+            pass
+
+    def clear(self) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+        except sqlite3.Error:
+            pass
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        disk_path: Optional[str] = None
+    ):
+        """
+        Two-tier response cache: an in-memory LRU with TTL and an optional SQLite tier.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk = DiskCache(disk_path, ttl_seconds) if disk_path else None
+
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached response for a key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if time.time() - created <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    REGISTRY.inc("cache_lookups_total", result="hit")
+                    return value
+                self._remove(key)
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value)
+                REGISTRY.inc("cache_lookups_total", result="disk_hit")
+                return value
+
+        with self._lock:
+            self.misses += 1
+        REGISTRY.inc("cache_lookups_total", result="miss")
+        return None
+
+    def contains(self, key: str) -> bool:
+        """
+        Whether a key is still cached, without counting a lookup or refreshing it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl_seconds:
+                return True
+        return self.disk is not None and self.disk.get(key) is not None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store a response in memory and, if configured, on disk.
+        """
+        with self._lock:
+            self._store(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def _store(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.time())
+        self._bytes += size
+        # Evict least recently used entries until both limits hold
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
@@ -0,0 +1,132 @@
+import hashlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from code_analyzer import CodeAnalyzer, describe_failure
+from context_cache import ContextCacheManager
+from prompts import get_question_prefix, get_question_suffix
+from rate_limiter import WaitCallback
+from retry import RetryError
+from token_accounting import estimate_tokens
+
+# Token budget for conversation turns (the code prefix is not counted)
+DEFAULT_HISTORY_TOKENS = 6000
+# Most recent question/answer pairs always kept verbatim
+DEFAULT_KEEP_RECENT_PAIRS = 2
+# Characters of each trimmed answer kept in the running summary
+SUMMARY_ANSWER_CHARS = 300
+
+# Acknowledgement turn that closes the code prefix in the chat history
+PREFIX_ACK = "Understood. I have read the code and will answer questions about it."
+
+
+def chat_key(code: str, language: str) -> str:
+    """
+    Key used to find the conversation for a snippet.
+    """
+    return hashlib.sha256(f"{language}\x00{code}".encode("utf-8")).hexdigest()
+
+
+class ChatSession:
+    def __init__(
+        self,
+        code: str,
+        language: str,
+        token_budget: int = DEFAULT_HISTORY_TOKENS,
+        keep_recent_pairs: int = DEFAULT_KEEP_RECENT_PAIRS
+    ):
+        """
+        Multi-turn conversation about one snippet. Older turns are folded into a
+        short summary once the history exceeds the token budget, so prompt size
+        stays bounded however long the conversation gets.
+        """
+        self.language = language
+        self.prefix = get_question_prefix(code, language)
+        self.token_budget = token_budget
+        self.keep_recent_pairs = keep_recent_pairs
+        self.turns: List[Tuple[str, str]] = []  # (role, text), alternating user/model
+        self.summary_lines: List[str] = []
+        self.trimmed_pairs = 0
+
+    @property
+    def question_count(self) -> int:
+        return len(self.turns) // 2 + self.trimmed_pairs
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary + "".join(text for _, text in self.turns))
+
+    def _summary_turns(self) -> List[Tuple[str, str]]:
+        if not self.summary:
+            return []
+        return [
+            ("user", f"Summary of our earlier conversation:\n{self.summary}"),
+            ("model", "Noted."),
+        ]
+
+    def history(self) -> List[Dict[str, Any]]:
+        """
+        Full history in model.start_chat format: code prefix, summary, recent turns.
+        """
+        turns = [("user", self.prefix), ("model", PREFIX_ACK)] + self._summary_turns() + self.turns
+        return [{"role": role, "parts": [text]} for role, text in turns]
+
+    def _trim(self) -> None:
+        """
+        Fold the oldest question/answer pairs into the summary until within budget.
+        """
+        while self.history_tokens() > self.token_budget and len(self.turns) > 2 * self.keep_recent_pairs:
+            (_, question), (_, answer) = self.turns[0], self.turns[1]
+            self.turns = self.turns[2:]
+            self.trimmed_pairs += 1
+            short_answer = " ".join(answer.split())[:SUMMARY_ANSWER_CHARS]
+            self.summary_lines.append(f"- Q: {' '.join(question.split())} A: {short_answer}")
+        # The summary is bounded too (about a quarter of the budget): drop its oldest entries
+        while len(self.summary) > self.token_budget and len(self.summary_lines) > 1:
+            self.summary_lines.pop(0)
+
+    def ask(
+        self,
+        analyzer: CodeAnalyzer,
+        question: str,
+        context_cache: Optional[ContextCacheManager] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> Iterator[str]:
+        """
+        Answer a follow-up question, yielding text chunks. When the code prefix is held
+        in a context cache, only the summary, recent turns and the question are sent.
+        Failed answers are not added to the history.
+        """
+        message = get_question_suffix(question)
+        parts: List[str] = []
+        try:
+            answer = None
+            if context_cache is not None:
+                answer = context_cache.ask(
+                    analyzer,
+                    self.prefix,
+                    self._summary_turns() + self.turns + [("user", message)],
+                    session_id=session_id,
+                    on_wait=on_wait
+                )
+            if answer is not None:
+                parts.append(answer)
+                yield answer
+            else:
+                for chunk in analyzer.stream_chat(
+                    self.history(), message, session_id=session_id, on_wait=on_wait
+                ):
+                    parts.append(chunk)
+                    yield chunk
+        except RetryError as e:
+            yield describe_failure(e)
+            return
+        except Exception as e:
+            yield f"\n\nError during analysis: {str(e)}"
+            return
+
+        self.turns += [("user", question), ("model", "".join(parts))]
+        self._trim()
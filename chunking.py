@@ -0,0 +1,213 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from async_analyzer import AsyncCodeAnalyzer
+from code_analyzer import CodeAnalyzer
+from prompts import get_chunk_prompt, get_merge_prompt
+from utils import get_lexer_for_language
+
+# Roughly 10k input tokens per chunk, leaving room for instructions and output
+CHUNK_CHAR_BUDGET = 40000
+
+# Keywords that open a top-level definition in common languages
+DEFINITION_KEYWORDS = {
+    "def", "class", "function", "func", "fn", "fun", "struct", "enum", "impl", "trait",
+    "interface", "module", "namespace", "object", "sub", "type", "procedure", "subroutine"
+}
+
+CHUNKABLE_MODES = ("Explain Code", "Debug Code", "Optimize Code", "Ask Question")
+
+# A unit is (first line index, source text)
+Unit = Tuple[int, str]
+
+
+def _definition_lines(code: str, language: str) -> List[int]:
+    """
+    Return the indices of lines that start a top-level function or class,
+    using Pygments tokens so braces and keywords inside strings and comments are ignored.
+    """
+    lexer = get_lexer_for_language(language)
+    if lexer is None:
+        return []
+    from pygments.token import Keyword, Name, Punctuation
+
+    lines = code.splitlines()
+    starts: List[int] = []
+    line = 0
+    depth = 0
+    for token_type, value in lexer.get_tokens(code):
+        top_level = depth == 0 and line < len(lines) and not lines[line][:1].isspace()
+        if top_level and value.strip() and (not starts or starts[-1] != line):
+            if (token_type in Keyword and value.strip() in DEFINITION_KEYWORDS) or \
+                    token_type in Name.Function or token_type in Name.Class:
+                starts.append(line)
+        if token_type in Punctuation:
+            depth = max(depth + value.count("{") - value.count("}"), 0)
+        line += value.count("\n")
+    return starts
+
+
+def _attach_leading_lines(lines: List[str], starts: List[int]) -> List[int]:
+    """
+    Move each boundary up over decorators and comment lines directly above it.
+    """
+    adjusted = []
+    for start in starts:
+        i = start
+        while i > 0:
+            above = lines[i - 1].lstrip()
+            if above.startswith(("@", "#", "//", "/*", "*", "--", "///")) and not lines[i - 1][:1].isspace():
+                i -= 1
+            else:
+                break
+        if not adjusted or i > adjusted[-1]:
+            adjusted.append(i)
+    return adjusted
+
+
+def split_into_units(code: str, language: str) -> List[Unit]:
+    """
+    Split code into top-level units (module preamble, then one unit per function or class).
+    """
+    lines = code.splitlines(keepends=True)
+    starts = _attach_leading_lines(lines, _definition_lines(code, language))
+    if not starts or starts[0] != 0:
+        starts = [0] + starts
+    bounds = starts + [len(lines)]
+    units = []
+    for begin, end in zip(bounds, bounds[1:]):
+        text = "".join(lines[begin:end])
+        if text.strip():
+            units.append((begin, text))
+    return units
+
+
+def pack_units(units: List[Unit], budget: int = CHUNK_CHAR_BUDGET) -> List[Unit]:
+    """
+    Greedily pack consecutive units into chunks no larger than the budget.
+    Units that are too large on their own are split on line boundaries.
+    """
+    chunks: List[Unit] = []
+    current: List[str] = []
+    current_start = 0
+    current_size = 0
+
+    def flush() -> None:
+        nonlocal current, current_size
+        if current:
+            chunks.append((current_start, "".join(current)))
+        current = []
+        current_size = 0
+
+    for start, text in units:
+        pieces = [(start, text)] if len(text) <= budget else _split_lines(start, text, budget)
+        for piece_start, piece in pieces:
+            if current_size + len(piece) > budget:
+                flush()
+            if not current:
+                current_start = piece_start
+            current.append(piece)
+            current_size += len(piece)
+    flush()
+    return chunks
+
+
+def _split_lines(start: int, text: str, budget: int) -> List[Unit]:
+    pieces: List[Unit] = []
+    buffer: List[str] = []
+    size = 0
+    line = start
+    piece_start = start
+    for source_line in text.splitlines(keepends=True):
+        if size + len(source_line) > budget and buffer:
+            pieces.append((piece_start, "".join(buffer)))
+            buffer, size, piece_start = [], 0, line
+        # A single line longer than the budget is hard-split
+        while len(source_line) > budget:
+            pieces.append((line, source_line[:budget]))
+            source_line = source_line[budget:]
+        buffer.append(source_line)
+        size += len(source_line)
+        line += 1
+    if buffer:
+        pieces.append((piece_start, "".join(buffer)))
+    return pieces
+
+
+def chunk_code(code: str, language: str, budget: int = CHUNK_CHAR_BUDGET) -> List[Unit]:
+    return pack_units(split_into_units(code, language), budget)
+
+
+def analyze_chunked(
+    analyzer: CodeAnalyzer,
+    code: str,
+    language: str,
+    mode: str,
+    detail_level: str = "Medium",
+    extra: str = "",
+    session_id: Optional[str] = None,
+    max_concurrency: int = 4,
+    budget: int = CHUNK_CHAR_BUDGET,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    merge_analyzer: Optional[CodeAnalyzer] = None
+) -> str:
+    """
+    Map-reduce analysis of a large file: analyze chunks concurrently, then merge
+    the notes into one report for the given mode. `extra` carries mode-specific
+    input such as the question or error message.
+    on_progress(done, total) is called from the calling thread as chunks finish.
+    merge_analyzer, if given, runs the merge steps (e.g. with a larger output budget).
+    Raises RetryError if any chunk or merge step fails, so a partial report is never returned.
+    """
+    merge_analyzer = merge_analyzer or analyzer
+    chunks = chunk_code(code, language, budget)
+    total = len(chunks)
+    prompts = {
+        str(i): get_chunk_prompt(text, language, mode, i, total, extra)
+        for i, (_, text) in enumerate(chunks, 1)
+    }
+    async_analyzer = AsyncCodeAnalyzer(analyzer, max_concurrency=max_concurrency, raise_on_failure=True)
+
+    async def run_map() -> Dict[str, str]:
+        notes = {}
+        async for label, text in async_analyzer.analyze_many(prompts, session_id=session_id):
+            notes[label] = text
+            if on_progress is not None:
+                on_progress(len(notes), total)
+        return notes
+
+    try:
+        notes = asyncio.run(run_map())
+    finally:
+        async_analyzer.cancel()
+    partials = [notes[str(i)] for i in range(1, total + 1)]
+
+    # Merge hierarchically if the notes themselves exceed the budget
+    while sum(len(p) for p in partials) > budget and len(partials) > 1:
+        groups = _group_by_budget(partials, budget)
+        if len(groups) == len(partials):
+            break
+        partials = [
+            merge_analyzer.generate_analysis(
+                get_merge_prompt(group, language, mode, detail_level, extra),
+                session_id=session_id
+            ) if len(group) > 1 else group[0]
+            for group in groups
+        ]
+
+    return merge_analyzer.generate_analysis(
+        get_merge_prompt(partials, language, mode, detail_level, extra),
+        session_id=session_id
+    )
+
+
+def _group_by_budget(texts: List[str], budget: int) -> List[List[str]]:
+    groups: List[List[str]] = [[]]
+    size = 0
+    for text in texts:
+        if groups[-1] and size + len(text) > budget:
+            groups.append([])
+            size = 0
+        groups[-1].append(text)
+        size += len(text)
+    return groups
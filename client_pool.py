@@ -0,0 +1,104 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from cache import ResponseCache
+from coalescing import RequestCoalescer
+from code_analyzer import CodeAnalyzer, DEFAULT_MODEL_NAME
+from near_duplicates import NearDuplicateIndex
+from rate_limiter import RequestScheduler
+from token_accounting import UsageRecorder
+
+# Drop analyzers that have not been used for this long
+DEFAULT_IDLE_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_SIZE = 64
+
+
+class AnalyzerPool:
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        usage_recorder: Optional[UsageRecorder] = None,
+        coalescer: Optional[RequestCoalescer] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        idle_ttl_seconds: float = DEFAULT_IDLE_TTL_SECONDS,
+        max_size: int = DEFAULT_MAX_SIZE
+    ):
+        """
+        Process-wide pool of CodeAnalyzer instances keyed by API key and model config.
+        Safe to share between Streamlit script threads.
+        """
+        self.cache = cache
+        self.scheduler = scheduler
+        self.usage_recorder = usage_recorder
+        self.coalescer = coalescer
+        self.near_duplicates = near_duplicates
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_size = max_size
+        self._analyzers: Dict[Tuple[str, str, str], CodeAnalyzer] = {}
+        self._last_used: Dict[Tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(api_key: str, model_name: str, generation_config: Optional[Dict[str, Any]]) -> Tuple[str, str, str]:
+        # Never keep raw keys around as dictionary keys
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        config = json.dumps(generation_config or {}, sort_keys=True, default=str)
+        return key_hash, model_name, config
+
+    def get(
+        self,
+        api_key: str,
+        model_name: str = DEFAULT_MODEL_NAME,
+        generation_config: Optional[Dict[str, Any]] = None
+    ) -> CodeAnalyzer:
+        """
+        Return a pooled analyzer for this key and config, creating it on first use.
+        """
+        key = self._key(api_key, model_name, generation_config)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            analyzer = self._analyzers.get(key)
+            if analyzer is None:
+                analyzer = CodeAnalyzer(
+                    api_key=api_key,
+                    cache=self.cache,
+                    model_name=model_name,
+                    generation_config=generation_config,
+                    scheduler=self.scheduler,
+                    usage_recorder=self.usage_recorder,
+                    coalescer=self.coalescer,
+                    near_duplicates=self.near_duplicates
+                )
+                self._analyzers[key] = analyzer
+                if len(self._analyzers) > self.max_size:
+                    # Drop the least recently used entry
+                    oldest = min(self._last_used, key=self._last_used.get)
+                    self._discard(oldest)
+            self._last_used[key] = now
+            return analyzer
+
+    def evict_idle(self) -> int:
+        """
+        Remove analyzers idle for longer than the TTL. Returns how many were removed.
+        """
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._analyzers)
+
+    def _evict_idle(self, now: float) -> int:
+        expired = [k for k, used in self._last_used.items() if now - used > self.idle_ttl_seconds]
+        for key in expired:
+            self._discard(key)
+        return len(expired)
+
+    def _discard(self, key: Tuple[str, str, str]) -> None:
+        self._analyzers.pop(key, None)
+        self._last_used.pop(key, None)
@@ -0,0 +1,181 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from rate_limiter import WaitCallback
+from retry import CallCancelled
+from telemetry import REGISTRY
+
+T = TypeVar("T")
+
+
+class SharedStream:
+    def __init__(self):
+        """
+        Chunks produced once by a pump thread and replayed to every subscriber.
+        Queue notifications are forwarded too, so each subscriber can show them
+        from its own thread.
+        """
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.wait_state: Optional[Tuple[int, float]] = None
+        self.wait_version = 0
+        self.subscribers = 0
+        self._cond = threading.Condition()
+
+    def notify_wait(self, position: int, eta: float) -> None:
+        """
+        WaitCallback for the source. Raises CallCancelled once every subscriber has
+        left, so a request nobody is waiting for gives up its place in the queue.
+        """
+        with self._cond:
+            if self.subscribers == 0:
+                raise CallCancelled("Every subscriber has left.")
+            self.wait_state = (position, eta)
+            self.wait_version += 1
+            self._cond.notify_all()
+
+    def pump(self, source: Iterator[str]) -> None:
+        """
+        Drain the source into the buffer. Stops early if every subscriber has left.
+        """
+        try:
+            for chunk in source:
+                with self._cond:
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+                    if self.subscribers == 0:
+                        break
+        except BaseException as e:
+            with self._cond:
+                self.error = e
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def join(self) -> bool:
+        """
+        Register a subscriber. Fails once the stream is finished or was abandoned
+        by all earlier subscribers (it may stop early then).
+        """
+        with self._cond:
+            if self.done or self.subscribers == 0:
+                return False
+            self.subscribers += 1
+            return True
+
+    def subscribe(self, on_wait: Optional[WaitCallback] = None) -> Iterator[str]:
+        """
+        Replay the stream from the start; call after join() (or as the first subscriber).
+        """
+        index = 0
+        seen_wait = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self.chunks) and not self.done and self.wait_version == seen_wait:
+                        self._cond.wait()
+                    new_chunks = self.chunks[index:]
+                    index = len(self.chunks)
+                    wait = self.wait_state if self.wait_version != seen_wait else None
+                    seen_wait = self.wait_version
+                    done, error = self.done, self.error
+                if wait is not None and on_wait is not None and not new_chunks:
+                    on_wait(*wait)
+                yield from new_chunks
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+class RequestCoalescer:
+    def __init__(self):
+        """
+        Single-flight deduplication: while a request for a key is in flight,
+        identical requests wait for it and get the same result or stream.
+        """
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, SharedStream] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def run(self, key: str, fn: Callable[[], T]) -> T:
+        """
+        Call fn() unless an identical call is already running; then wait for its result
+        (or its exception).
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            REGISTRY.inc("coalesced_requests_total", kind="call")
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(
+        self,
+        key: str,
+        factory: Callable[[WaitCallback], Iterator[str]],
+        on_wait: Optional[WaitCallback] = None
+    ) -> Iterator[str]:
+        """
+        Subscribe to the stream for a key, starting factory(notify_wait) if none is
+        in flight. The source runs in its own thread, so any subscriber can stop
+        reading without affecting the others.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            start = shared is None or not shared.join()
+            if start:
+                shared = SharedStream()
+                shared.subscribers = 1
+                self._streams[key] = shared
+                self.leaders += 1
+            else:
+                self.followers += 1
+            subscription = shared.subscribe(on_wait)
+
+        if start:
+            def run() -> None:
+                try:
+                    shared.pump(factory(shared.notify_wait))
+                finally:
+                    with self._lock:
+                        if self._streams.get(key) is shared:
+                            del self._streams[key]
+
+            threading.Thread(target=run, daemon=True).start()
+        else:
+            REGISTRY.inc("coalesced_requests_total", kind="stream")
+        return subscription
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._streams)
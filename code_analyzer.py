@@ -1,60 +1,449 @@
+import hashlib
 import os
 import time
-import google.generativeai as genai
-from typing import Optional
-from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from cache import ResponseCache, make_cache_key
+from coalescing import RequestCoalescer
+from near_duplicates import NearDuplicateIndex, minhash_signature
+from retry import EmptyResponseError, RetryError, RetryPolicy, get_circuit_breaker
+from rate_limiter import RequestScheduler, WaitCallback
+from token_accounting import UsageRecorder, estimate_tokens
+from telemetry import REGISTRY
 
-load_dotenv()
+DEFAULT_MODEL_NAME = "gemini-3-pro-preview"
+
+DEFAULT_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 8192,
+}
 
 class CodeAnalyzer:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        model_name: str = DEFAULT_MODEL_NAME,
+        generation_config: Optional[Dict[str, Any]] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        usage_recorder: Optional[UsageRecorder] = None,
+        coalescer: Optional[RequestCoalescer] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None
+    ):
         """
-        Initialize the Gemini AI model.
+        Initialize the Gemini AI model, optionally backed by a shared response cache,
+        a rate-limiting request scheduler, a usage recorder, a request coalescer
+        that merges identical in-flight requests and an index of cached analyses
+        by snippet similarity.
         """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
             raise ValueError("Google API Key not found. Please set GOOGLE_API_KEY in .env file.")
-        
-        genai.configure(api_key=self.api_key)
+        self.key_hash = hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()
         
         # Configuration for the model
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 1,
-            "top_k": 1,
-            "max_output_tokens": 8192,
-        }
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or DEFAULT_GENERATION_CONFIG)
         
+        # The SDK takes most of a second to import; load it with the first analyzer
+        import google.generativeai as genai
+        from google.ai import generativelanguage as glm
+
         self.model = genai.GenerativeModel(
-            model_name="gemini-3-pro-preview",
-            generation_config=generation_config
+            model_name=self.model_name,
+            generation_config=self.generation_config
+        )
+        # Bind a client to this key instead of calling genai.configure(),
+        # which is process-global and races between sessions using different keys
+        self.client = glm.GenerativeServiceClient(
+            client_options={"api_key": self.api_key}
+        )
+        self.model._client = self.client
+        self.cache = cache
+        self.scheduler = scheduler
+        self.usage_recorder = usage_recorder
+        self.coalescer = coalescer
+        self.near_duplicates = near_duplicates
+        # Shared by every analyzer using the same key and model
+        self.circuit_breaker = get_circuit_breaker(self.model_name, self.api_key)
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        Make one API call. Raises on failure, including empty responses.
+        """
+        request_options = {"timeout": timeout} if timeout else None
+        with REGISTRY.span("generate"):
+            response = self.model.generate_content(prompt, request_options=request_options)
+        self._record_usage(response)
+        if not response.text:
+            raise EmptyResponseError("AI returned an empty response.")
+        return response.text
+
+    def _open_stream(self, prompt: str, timeout: Optional[float] = None) -> Tuple[Any, Iterator[Any]]:
+        """
+        Start a streaming call and wait for the first chunk with text, so that failures
+        before any output can still be retried. Returns that chunk and the rest of the stream.
+        """
+        request_options = {"timeout": timeout} if timeout else None
+        chunks = iter(self.model.generate_content(prompt, stream=True, request_options=request_options))
+        return _first_text_chunk(chunks), chunks
+
+    def _open_chat_stream(
+        self,
+        history: List[Dict[str, Any]],
+        message: str,
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, Iterator[Any]]:
+        """
+        Start a chat over the given history and stream the reply to `message`,
+        waiting for the first text chunk like _open_stream.
+        """
+        request_options = {"timeout": timeout} if timeout else None
+        chat = self.model.start_chat(history=history)
+        chunks = iter(chat.send_message(message, stream=True, request_options=request_options))
+        return _first_text_chunk(chunks), chunks
+
+    def _generate_cached(
+        self,
+        cached_content: str,
+        contents: List[Tuple[str, str]],
+        timeout: Optional[float] = None
+    ) -> str:
+        """
+        Make one API call on top of an explicit context cache, sending only `contents`
+        as (role, text) turns. Raises on failure, including empty responses.
+        """
+        from google.ai import generativelanguage as glm
+
+        request = glm.GenerateContentRequest(
+            model=f"models/{self.model_name}",
+            cached_content=cached_content,
+            contents=[glm.Content(role=role, parts=[glm.Part(text=text)]) for role, text in contents],
+            generation_config=glm.GenerationConfig(**self.generation_config)
         )
+        with REGISTRY.span("generate"):
+            response = self.client.generate_content(request, timeout=timeout)
+        self._record_usage(response)
+        text = ""
+        if response.candidates:
+            text = "".join(part.text for part in response.candidates[0].content.parts)
+        if not text:
+            raise EmptyResponseError("AI returned an empty response.")
+        return text
+
+    def _record_usage(self, response: Any) -> None:
+        if self.usage_recorder is not None:
+            self.usage_recorder.record(
+                self.model_name,
+                self.generation_config.get("max_output_tokens", 0),
+                getattr(response, "usage_metadata", None)
+            )
+
+    def _consume_stream(self, first: Any, chunks: Iterator[Any], started: float) -> Iterator[str]:
+        """
+        Yield text from an opened stream; usage is recorded from the last chunk,
+        which carries the totals for the whole response. `started` is the
+        perf_counter value when the request began (before queueing).
+        """
+        REGISTRY.observe("time_to_first_token_seconds", time.perf_counter() - started)
+        last = first
+        yield _chunk_text(first)
+        for chunk in chunks:
+            last = chunk
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+        REGISTRY.observe("stage_seconds", time.perf_counter() - started, stage="stream")
+        self._record_usage(last)
+
+    def _wait_for_slot(
+        self,
+        prompt: str,
+        session_id: Optional[str],
+        on_wait: Optional[WaitCallback],
+        timeout: Optional[float]
+    ) -> None:
+        """
+        Block until the scheduler lets this request through (no-op without a scheduler).
+        """
+        if self.scheduler is None:
+            return
+        with REGISTRY.span("queue"):
+            self.scheduler.acquire(
+                self.api_key,
+                session_id or "default",
+                tokens=estimate_tokens(prompt),
+                on_wait=on_wait,
+                timeout=timeout
+            )
+
+    def _scheduled(
+        self,
+        call: Any,
+        prompt: str,
+        session_id: Optional[str],
+        on_wait: Optional[WaitCallback]
+    ) -> Any:
+        """
+        Wrap an API call so each attempt first waits for a rate limit slot.
+        """
+        def attempt(remaining: float) -> Any:
+            self._wait_for_slot(prompt, session_id, on_wait, remaining)
+            return call(prompt, remaining)
+        return attempt
+
+    def _cache_key(self, prompt: str) -> str:
+        return make_cache_key(prompt, self.model_name, self.generation_config)
+
+    def _coalescing_key(self, key: str) -> str:
+        # In-flight calls are only shared within one API key: a call runs on its
+        # leader's key, quota and rate limit budget
+        return f"{key}:{self.key_hash}"
+
+    def cached_result(self, prompt: str) -> Optional[str]:
+        """
+        The cached response for a prompt, if any, without calling the API.
+        """
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(prompt))
+
+    def similar_result(self, code: str, language: str, scope: str) -> Optional[Dict[str, Any]]:
+        """
+        A cached analysis of a snippet that differs from this one only in names,
+        literals, comments or layout, if one is similar enough: its text and the
+        estimated similarity. The matched snippet itself is never kept, since it
+        may belong to another user.
+        scope identifies the request apart from the code (mode and its settings).
+        """
+        if self.near_duplicates is None or self.cache is None:
+            return None
+        signature = minhash_signature(code, language)
+        if signature is None:
+            return None
+        # Entries whose analysis has since been evicted are skipped (and dropped)
+        match = self.near_duplicates.find(signature, scope, is_live=self.cache.contains)
+        if match is None:
+            return None
+        key, similarity = match
+        result = self.cache.get(key)
+        if result is None:
+            return None
+        REGISTRY.inc("cache_lookups_total", result="near_duplicate")
+        return {"result": result, "similarity": similarity}
+
+    def remember_similar(self, code: str, language: str, scope: str, prompt: str) -> None:
+        """
+        Make the cached analysis of this prompt available to similar snippets.
+        """
+        if self.near_duplicates is None or self.cache is None:
+            return
+        key = self._cache_key(prompt)
+        signature = minhash_signature(code, language)
+        if signature is None or self.cache.get(key) is None:
+            return
+        self.near_duplicates.add(signature, scope, key)
 
     def analyze_code(self, prompt: str) -> str:
         """
-        Send the prompt to Gemini and return the response.
+        Send the prompt to Gemini once and return the response.
+        Successful responses are served from and stored in the cache when one is set.
         """
+        key = self._cache_key(prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
         try:
-            response = self.model.generate_content(prompt)
-            if response.text:
-                return response.text
-            else:
-                return "AI returned an empty response. Please try again."
+            text = self._generate(prompt)
+        except EmptyResponseError:
+            return "AI returned an empty response. Please try again."
         except Exception as e:
             return f"Error during analysis: {str(e)}"
+        if self.cache is not None:
+            self.cache.set(key, text)
+        return text
+
+    def stream_analysis(
+        self,
+        prompt: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None,
+        raise_on_failure: bool = False,
+        on_first_token: Optional[Callable[[float], None]] = None
+    ) -> Iterator[str]:
+        """
+        Stream the response to a prompt as text chunks.
+        Errors before the first chunk are retried; the complete text is cached once the stream finishes.
+        on_wait(position, estimated_seconds) is called while the request is queued by the scheduler.
+        If the request fails before any output, a readable message is yielded, or
+        RetryError is raised when raise_on_failure is set (so callers can fail over).
+        on_first_token(seconds) gets the model's own first-token latency, from the
+        rate limit slot to the first chunk; it is not called for cache hits.
+        """
+        key = self._cache_key(prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        try:
+            if self.coalescer is not None:
+                yield from self.coalescer.stream(
+                    self._coalescing_key(key),
+                    lambda notify: self._stream_uncached(
+                        prompt, key, retry_policy, session_id, notify, on_first_token
+                    ),
+                    on_wait
+                )
+            else:
+                yield from self._stream_uncached(prompt, key, retry_policy, session_id, on_wait, on_first_token)
+        except RetryError as e:
+            if raise_on_failure:
+                raise
+            yield describe_failure(e)
+
+    def _stream_uncached(
+        self,
+        prompt: str,
+        key: str,
+        retry_policy: Optional[RetryPolicy],
+        session_id: Optional[str],
+        on_wait: Optional[WaitCallback],
+        on_first_token: Optional[Callable[[float], None]] = None
+    ) -> Iterator[str]:
+        """
+        Raises RetryError if the stream cannot be opened; later errors are yielded as text.
+        """
+        def open_stream(_prompt: str, remaining: float) -> Tuple[Any, Iterator[Any], float]:
+            # Called once the scheduler has granted a slot, so queueing is not counted
+            opened = time.perf_counter()
+            first, chunks = self._open_stream(prompt, remaining)
+            return first, chunks, time.perf_counter() - opened
+
+        policy = retry_policy or self.default_retry_policy()
+        started = time.perf_counter()
+        first, chunks, first_token_seconds = policy.call(self._scheduled(open_stream, prompt, session_id, on_wait))
+        if on_first_token is not None:
+            on_first_token(first_token_seconds)
+
+        parts = []
+        try:
+            for text in self._consume_stream(first, chunks, started):
+                parts.append(text)
+                yield text
+        except Exception as e:
+            yield f"\n\nError during analysis: {str(e)}"
+            return
 
-    def analyze_with_retry(self, prompt: str, max_retries: int = 3) -> str:
+        if self.cache is not None:
+            self.cache.set(key, "".join(parts))
+
+    def stream_chat(
+        self,
+        history: List[Dict[str, Any]],
+        message: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> Iterator[str]:
         """
-        Send prompt with a simple retry logic for rate limiting or transient errors.
+        Stream the reply to `message` in a chat with the given history
+        (model.start_chat format). Unlike stream_analysis, failures are raised:
+        RetryError before the first chunk, the SDK error after it.
         """
-        for i in range(max_retries):
-            try:
-                return self.analyze_code(prompt)
-            except Exception as e:
-                if i == max_retries - 1:
-                    return f"Failed after {max_retries} attempts: {str(e)}"
-                time.sleep(2 ** i) # Exponential backoff
-        return "Unknown error occurred during analysis."
+        sent_text = "\n".join(
+            part for turn in history for part in turn["parts"]
+        ) + "\n" + message
+
+        def open_stream(_prompt: str, remaining: float) -> Tuple[Any, Iterator[Any]]:
+            return self._open_chat_stream(history, message, remaining)
+
+        policy = retry_policy or self.default_retry_policy()
+        started = time.perf_counter()
+        first, chunks = policy.call(self._scheduled(open_stream, sent_text, session_id, on_wait))
+        yield from self._consume_stream(first, chunks, started)
+
+    def default_retry_policy(self) -> RetryPolicy:
+        return RetryPolicy(circuit_breaker=self.circuit_breaker)
+
+    def generate_analysis(
+        self,
+        prompt: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> str:
+        """
+        Send the prompt, retrying rate limits, server errors, timeouts and empty responses
+        with jittered backoff. Auth errors and safety blocks fail immediately.
+        Raises RetryError when the analysis cannot be produced.
+        """
+        key = self._cache_key(prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        def generate() -> str:
+            policy = retry_policy or self.default_retry_policy()
+            text = policy.call(self._scheduled(self._generate, prompt, session_id, on_wait))
+            if self.cache is not None:
+                self.cache.set(key, text)
+            return text
+
+        if self.coalescer is not None:
+            return self.coalescer.run(self._coalescing_key(key), generate)
+        return generate()
+
+    def generate_with_context(
+        self,
+        cached_content: str,
+        contents: List[Tuple[str, str]],
+        cache_key_prompt: Optional[str] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> str:
+        """
+        Like generate_analysis, but the static prefix lives in an explicit context cache
+        and only `contents` is sent. `cache_key_prompt` (normally the equivalent full
+        prompt) enables the response cache. Raises RetryError on failure.
+        """
+        key = self._cache_key(cache_key_prompt) if cache_key_prompt is not None else None
+        if self.cache is not None and key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        sent_text = "\n".join(text for _, text in contents)
+        def call(_prompt: str, remaining: float) -> str:
+            return self._generate_cached(cached_content, contents, remaining)
+
+        policy = retry_policy or self.default_retry_policy()
+        text = policy.call(self._scheduled(call, sent_text, session_id, on_wait))
+        if self.cache is not None and key is not None:
+            self.cache.set(key, text)
+        return text
+
+    def analyze_with_retry(
+        self,
+        prompt: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> str:
+        """
+        Like generate_analysis, but returns a readable error message instead of raising.
+        """
+        try:
+            return self.generate_analysis(prompt, retry_policy, session_id, on_wait)
+        except RetryError as e:
+            return describe_failure(e)
 
     def check_api_status(self) -> bool:
         """
@@ -66,3 +455,35 @@ class CodeAnalyzer:
             return True
         except Exception:
             return False
+
+
+def _chunk_text(chunk: Any) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. a trailing finish reason)
+        return ""
+
+
+def _first_text_chunk(chunks: Iterator[Any]) -> Any:
+    for chunk in chunks:
+        if _chunk_text(chunk):
+            return chunk
+    raise EmptyResponseError("AI returned an empty response.")
+
+
+def describe_failure(error: RetryError) -> str:
+    """
+    Turn a final retry failure into a message for the result pane.
+    """
+    messages = {
+        "auth": "Authentication failed. Please check your Google API Key.",
+        "safety_block": "The request was blocked by the model's safety filters.",
+        "rate_limit": "The API rate limit was reached. Please try again in a moment.",
+        "queue_timeout": "Too many requests are queued for this API key. Please try again in a moment.",
+        "empty_response": "AI returned an empty response. Please try again.",
+    }
+    message = messages.get(error.kind)
+    if message:
+        return message
+    return f"Error during analysis: {str(error)}"
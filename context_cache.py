@@ -0,0 +1,188 @@
+import datetime
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from code_analyzer import CodeAnalyzer
+from rate_limiter import WaitCallback
+from retry import INVALID_REQUEST, RetryError
+from token_accounting import estimate_tokens
+
+DEFAULT_TTL_SECONDS = 10 * 60
+
+# Explicit caching has a minimum input size; smaller prefixes are sent inline
+MIN_CACHEABLE_TOKENS = 4096
+
+
+class GeminiContextCache:
+    """
+    Backend using Gemini explicit context caching (CachedContent).
+    """
+
+    def create(self, analyzer: CodeAnalyzer, prefix: str, ttl_seconds: float) -> str:
+        from google.ai import generativelanguage as glm
+
+        client = glm.CacheServiceClient(client_options={"api_key": analyzer.api_key})
+        cached = client.create_cached_content(
+            cached_content=glm.CachedContent(
+                model=f"models/{analyzer.model_name}",
+                contents=[glm.Content(role="user", parts=[glm.Part(text=prefix)])],
+                ttl=datetime.timedelta(seconds=ttl_seconds)
+            )
+        )
+        return cached.name
+
+    def generate(
+        self,
+        analyzer: CodeAnalyzer,
+        handle: str,
+        contents: List[Tuple[str, str]],
+        full_prompt: str,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> str:
+        return analyzer.generate_with_context(
+            handle, contents, cache_key_prompt=full_prompt, session_id=session_id, on_wait=on_wait
+        )
+
+    def delete(self, analyzer: CodeAnalyzer, handle: str) -> None:
+        from google.ai import generativelanguage as glm
+
+        client = glm.CacheServiceClient(client_options={"api_key": analyzer.api_key})
+        client.delete_cached_content(name=handle)
+
+
+class LocalContextCache:
+    """
+    Stand-in backend for tests and offline runs: keeps prefixes in memory and
+    sends the full prompt through the analyzer.
+    """
+
+    def __init__(self):
+        self.prefixes: Dict[str, str] = {}
+        self.created = 0
+
+    def create(self, analyzer: CodeAnalyzer, prefix: str, ttl_seconds: float) -> str:
+        handle = "local/" + hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        self.prefixes[handle] = prefix
+        self.created += 1
+        return handle
+
+    def generate(
+        self,
+        analyzer: CodeAnalyzer,
+        handle: str,
+        contents: List[Tuple[str, str]],
+        full_prompt: str,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> str:
+        prompt = self.prefixes[handle] + "".join(text for _, text in contents)
+        return analyzer.generate_analysis(prompt, session_id=session_id, on_wait=on_wait)
+
+    def delete(self, analyzer: CodeAnalyzer, handle: str) -> None:
+        self.prefixes.pop(handle, None)
+
+
+class ContextCacheManager:
+    def __init__(
+        self,
+        backend=None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        min_tokens: int = MIN_CACHEABLE_TOKENS
+    ):
+        """
+        Keeps one context cache per (API key, model, prompt prefix), so follow-up
+        questions about the same snippet only send the new question.
+        """
+        self.backend = backend or GeminiContextCache()
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._handles: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _key(self, analyzer: CodeAnalyzer, prefix: str) -> str:
+        digest = hashlib.sha256()
+        for part in (analyzer.api_key, analyzer.model_name, prefix):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get_or_create(self, analyzer: CodeAnalyzer, prefix: str) -> Optional[str]:
+        """
+        Return a cache handle for the prefix, or None if it is too small to cache
+        or the cache could not be created (callers then send the full prompt).
+        """
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None
+
+        key = self._key(analyzer, prefix)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._handles.get(key)
+            # Recreate a little before the server-side TTL runs out
+            if entry is not None and entry[1] - now > 30:
+                self.reused += 1
+                return entry[0]
+
+        try:
+            handle = self.backend.create(analyzer, prefix, self.ttl_seconds)
+        except Exception:
+            return None
+        with self._lock:
+            self._handles[key] = (handle, now + self.ttl_seconds)
+            self.created += 1
+            self._drop_expired(now)
+        return handle
+
+    def ask(
+        self,
+        analyzer: CodeAnalyzer,
+        prefix: str,
+        contents: List[Tuple[str, str]],
+        full_prompt: Optional[str] = None,
+        session_id: Optional[str] = None,
+        on_wait: Optional[WaitCallback] = None
+    ) -> Optional[str]:
+        """
+        Answer using the cached prefix plus the given (role, text) turns.
+        full_prompt (the equivalent inline prompt), if given, enables the response cache.
+        Returns None when no context cache is available for this prefix or it was
+        rejected; the caller then sends everything inline.
+        Raises RetryError if the request fails.
+        """
+        handle = self.get_or_create(analyzer, prefix)
+        if handle is None:
+            return None
+        try:
+            return self.backend.generate(
+                analyzer, handle, contents, full_prompt, session_id=session_id, on_wait=on_wait
+            )
+        except RetryError as e:
+            if e.kind != INVALID_REQUEST:
+                raise
+            # The cache was rejected (e.g. expired early); forget it and let the caller send inline
+            self.invalidate(analyzer, prefix)
+            return None
+
+    def invalidate(self, analyzer: CodeAnalyzer, prefix: str) -> None:
+        """
+        Forget the prefix's cache and delete it on the server (best effort).
+        """
+        with self._lock:
+            entry = self._handles.pop(self._key(analyzer, prefix), None)
+        if entry is None:
+            return
+        try:
+            self.backend.delete(analyzer, entry[0])
+        except Exception:
+            # Already gone; the server-side TTL removes it otherwise
+            pass
+
+    def _drop_expired(self, now: float) -> None:
+        expired = [k for k, (_, expires) in self._handles.items() if expires <= now]
+        for key in expired:
+            del self._handles[key]
@@ -0,0 +1,90 @@
+import difflib
+from typing import Any, Dict, List
+
+from prompts import get_comparison_prompt, get_diff_comparison_prompt
+from utils import extract_functions
+
+# Context lines around each hunk shown in the UI
+DIFF_CONTEXT_LINES = 3
+# Context lines per hunk when the base version is too large to send in full
+WIDE_CONTEXT_LINES = 12
+# Base versions up to this size are sent in full alongside the diff
+FULL_BASE_MAX_CHARS = 8000
+# Below this line similarity the snippets are different implementations; compare them whole
+MIN_DIFF_SIMILARITY = 0.5
+
+
+class CodeDiff:
+    def __init__(self, code1: str, code2: str):
+        """
+        Line-level diff between two versions of a snippet (difflib, no junk heuristic
+        so repeated lines such as braces still align).
+        """
+        self.lines1 = code1.splitlines()
+        self.lines2 = code2.splitlines()
+        self.matcher = difflib.SequenceMatcher(None, self.lines1, self.lines2, autojunk=False)
+        self.opcodes = self.matcher.get_opcodes()
+
+    def stats(self) -> Dict[str, Any]:
+        added = removed = 0
+        for tag, i1, i2, j1, j2 in self.opcodes:
+            if tag in ("replace", "delete"):
+                removed += i2 - i1
+            if tag in ("replace", "insert"):
+                added += j2 - j1
+        return {
+            "added": added,
+            "removed": removed,
+            "hunks": len(list(self.matcher.get_grouped_opcodes(DIFF_CONTEXT_LINES))) if added or removed else 0,
+            "similarity": self.matcher.ratio(),
+        }
+
+    def unified(self, context: int = DIFF_CONTEXT_LINES) -> str:
+        """
+        Unified diff text (version 1 -> version 2) with the given context.
+        """
+        if self.lines1 == self.lines2:
+            return ""
+        out: List[str] = []
+        for group in self.matcher.get_grouped_opcodes(context):
+            first, last = group[0], group[-1]
+            out.append(f"@@ -{first[1] + 1},{last[2] - first[1]} +{first[3] + 1},{last[4] - first[3]} @@")
+            for tag, i1, i2, j1, j2 in group:
+                if tag == "equal":
+                    out.extend(" " + line for line in self.lines1[i1:i2])
+                    continue
+                if tag in ("replace", "delete"):
+                    out.extend("-" + line for line in self.lines1[i1:i2])
+                if tag in ("replace", "insert"):
+                    out.extend("+" + line for line in self.lines2[j1:j2])
+        return "\n".join(out)
+
+
+def diff_stats(code1: str, code2: str) -> Dict[str, Any]:
+    """
+    Stats for the UI: lines added/removed, hunks, similarity, and the diff itself.
+    """
+    diff = CodeDiff(code1, code2)
+    return {**diff.stats(), "diff": diff.unified()}
+
+
+def build_comparison_prompt(code1: str, code2: str, programming_language: str) -> str:
+    """
+    Compare prompt that sends shared code once: version 1 (or, if large, an outline
+    plus wide-context hunks) and the diff to version 2. Falls back to the
+    full side-by-side prompt when the snippets are mostly different.
+    """
+    diff = CodeDiff(code1, code2)
+    if diff.matcher.ratio() < MIN_DIFF_SIMILARITY:
+        return get_comparison_prompt(code1, code2, programming_language)
+
+    if len(code1) <= FULL_BASE_MAX_CHARS:
+        prompt = get_diff_comparison_prompt(diff.unified(), programming_language, base=code1)
+    else:
+        outline = extract_functions(code1, programming_language)
+        prompt = get_diff_comparison_prompt(
+            diff.unified(WIDE_CONTEXT_LINES), programming_language, outline=outline
+        )
+
+    full_prompt = get_comparison_prompt(code1, code2, programming_language)
+    return prompt if len(prompt) < len(full_prompt) else full_prompt
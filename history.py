@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Entries kept per session; older ones are deleted from disk
+DEFAULT_MAX_ENTRIES_PER_SESSION = 50
+# Sessions not seen for this long are removed entirely
+DEFAULT_RETENTION_SECONDS = 30 * 24 * 60 * 60
+# Characters of the result kept in memory for the sidebar
+PREVIEW_CHARS = 150
+
+
+def make_preview(result: str, size: int = PREVIEW_CHARS) -> str:
+    preview = " ".join(result[: size * 2].split())
+    return preview[:size] + "..." if len(preview) > size or len(result) > size * 2 else preview
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        path: str,
+        max_entries_per_session: int = DEFAULT_MAX_ENTRIES_PER_SESSION,
+        retention_seconds: float = DEFAULT_RETENTION_SECONDS
+    ):
+        """
+        Analysis history on disk: full results zlib-compressed in SQLite, compact
+        entries (metadata plus preview) for display. Survives restarts.
+        """
+        self.path = path
+        self.max_entries_per_session = max_entries_per_session
+        self.retention_seconds = retention_seconds
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL, created REAL NOT NULL, "
+                "mode TEXT NOT NULL, lang TEXT NOT NULL, preview TEXT NOT NULL, result BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS history_session ON history (session, id)")
+        self.prune()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _entry(row: tuple) -> Dict[str, Any]:
+        entry_id, created, mode, lang, preview = row
+        return {"id": entry_id, "created": created, "mode": mode, "lang": lang, "preview": preview}
+
+    def add(self, session_id: str, mode: str, lang: str, result: str) -> Dict[str, Any]:
+        """
+        Store a result and return its compact entry. Evicts the session's oldest
+        entries beyond the cap.
+        """
+        created = time.time()
+        preview = make_preview(result)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO history (session, created, mode, lang, preview, result) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, created, mode, lang, preview, zlib.compress(result.encode("utf-8"), 6))
+            )
+            conn.execute(
+                "DELETE FROM history WHERE session = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE session = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_entries_per_session)
+            )
+        return self._entry((cursor.lastrowid, created, mode, lang, preview))
+
+    def entries(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Most recent compact entries for a session, oldest first. Results are not read.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, created, mode, lang, preview FROM history WHERE session = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def load(self, session_id: str, entry_id: int) -> Optional[str]:
+        """
+        Full result for an entry of this session, or None if it was evicted.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM history WHERE session = ? AND id = ?", (session_id, entry_id)
+            ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def clear(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM history WHERE session = ?", (session_id,))
+
+    def prune(self) -> None:
+        """
+        Remove sessions whose newest entry is older than the retention period.
+        """
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM history WHERE session IN "
+                "(SELECT session FROM history GROUP BY session HAVING MAX(created) < ?)",
+                (cutoff,)
+            )
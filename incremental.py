@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from async_analyzer import AsyncCodeAnalyzer
+from chunking import CHUNK_CHAR_BUDGET, Unit, split_into_units
+from code_analyzer import CodeAnalyzer
+from prompts import get_unit_prompt
+
+INCREMENTAL_MODES = ("Explain Code", "Debug Code", "Optimize Code")
+
+# Consecutive units are grouped into sections. A section ends after a unit whose
+# hash is divisible by this (about 3 units per section on average), so boundaries
+# depend only on unit content and an edit changes at most its own and the next section.
+SECTION_BOUNDARY_MODULUS = 3
+SECTION_CHAR_BUDGET = CHUNK_CHAR_BUDGET // 4
+
+# Title length for a section header
+TITLE_CHARS = 80
+
+
+def normalize_unit(text: str) -> str:
+    """
+    Canonical form used for hashing and prompting: trailing whitespace and
+    surrounding blank lines do not count as edits.
+    """
+    return "\n".join(line.rstrip() for line in text.strip("\n").splitlines())
+
+
+def unit_hash(text: str) -> str:
+    return hashlib.sha256(normalize_unit(text).encode("utf-8")).hexdigest()
+
+
+def _title(text: str) -> str:
+    """
+    First line of a unit that is not a decorator or comment, e.g. "def parse(data):".
+    """
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith(("@", "#", "//", "/*", "*", "--")):
+            return stripped[:TITLE_CHARS]
+    return "Module"
+
+
+def group_units(units: List[Unit]) -> List[List[Unit]]:
+    """
+    Group units into sections with content-defined boundaries.
+    """
+    sections: List[List[Unit]] = []
+    current: List[Unit] = []
+    size = 0
+    for unit in units:
+        if current and size + len(unit[1]) > SECTION_CHAR_BUDGET:
+            sections.append(current)
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit[1])
+        if int(unit_hash(unit[1])[:8], 16) % SECTION_BOUNDARY_MODULUS == 0:
+            sections.append(current)
+            current, size = [], 0
+    if current:
+        sections.append(current)
+    return sections
+
+
+def analyze_incremental(
+    analyzer: CodeAnalyzer,
+    code: str,
+    language: str,
+    mode: str,
+    detail_level: str = "Medium",
+    extra: str = "",
+    session_id: Optional[str] = None,
+    max_concurrency: int = 4,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> Tuple[str, int, int]:
+    """
+    Analyze code section by section (functions and classes, grouped), reusing the
+    cached analysis of every section whose code has not changed, and stitch the
+    sections into one report in source order.
+    Returns (report, reused sections, total sections).
+    on_progress(done, total) counts only the sections that had to be analyzed.
+    Raises RetryError if any section fails, so a partial report is never returned.
+    """
+    sections = group_units(split_into_units(code, language))
+    prompts = [
+        get_unit_prompt(
+            "\n\n".join(normalize_unit(text) for _, text in section), language, mode, detail_level, extra
+        )
+        for section in sections
+    ]
+
+    notes: Dict[str, str] = {}
+    missing: Dict[str, str] = {}
+    for i, prompt in enumerate(prompts):
+        cached = analyzer.cached_result(prompt)
+        if cached is not None:
+            notes[str(i)] = cached
+        else:
+            missing[str(i)] = prompt
+
+    if missing:
+        async_analyzer = AsyncCodeAnalyzer(analyzer, max_concurrency=max_concurrency, raise_on_failure=True)
+
+        async def run() -> None:
+            done = 0
+            async for label, text in async_analyzer.analyze_many(missing, session_id=session_id):
+                notes[label] = text
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, len(missing))
+
+        try:
+            asyncio.run(run())
+        finally:
+            async_analyzer.cancel()
+
+    parts = []
+    for i, section in enumerate(sections):
+        title = " · ".join(f"`{_title(text)}`" for _, text in section)
+        parts.append(f"## {title}\n\n{notes[str(i)].strip()}")
+    return "\n\n".join(parts), len(sections) - len(missing), len(sections)
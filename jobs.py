@@ -0,0 +1,256 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from retry import CallCancelled
+from telemetry import REGISTRY
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = {DONE, FAILED, CANCELLED}
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_ACTIVE_PER_OWNER = 2
+# Finished jobs are kept this long so a reloaded page can still pick up the result
+DEFAULT_RETENTION_SECONDS = 60 * 60
+
+
+class JobCancelled(CallCancelled):
+    """
+    Raised inside a job's work function once the job has been cancelled.
+    """
+
+
+class JobLimitError(Exception):
+    """
+    Raised when an owner already has the maximum number of active jobs.
+    """
+
+
+class Job:
+    def __init__(self, job_id: str, owner: str, key: str, meta: Optional[Dict[str, Any]] = None):
+        """
+        One background analysis: its state, the text streamed so far, progress
+        and notes for the UI. Updated by the worker, read by any script run.
+        """
+        self.id = job_id
+        self.owner = owner
+        self.key = key
+        self.meta = dict(meta or {})
+        self.status = QUEUED
+        self.chunks: List[str] = []
+        self.progress: Optional[Tuple[int, int, str]] = None
+        self.wait_state: Optional[Tuple[int, float]] = None
+        self.notes: List[str] = []
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.version = 0
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _update(self, **fields: Any) -> None:
+        with self._cond:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._cond.notify_all()
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def append(self, chunk: str) -> None:
+        """
+        Add streamed text. Raises JobCancelled if the job was cancelled.
+        """
+        self.check_cancelled()
+        with self._cond:
+            self.chunks.append(chunk)
+            self.wait_state = None
+            self.version += 1
+            self._cond.notify_all()
+
+    def set_progress(self, done: int, total: int, label: str = "") -> None:
+        """
+        Report progress of multi-part work. Raises JobCancelled if the job was cancelled.
+        """
+        self.check_cancelled()
+        self._update(progress=(done, total, label), wait_state=None)
+
+    def notify_wait(self, position: int, eta: float) -> None:
+        """
+        WaitCallback for the rate limiter: the request's place in its queue.
+        Raises JobCancelled if the job was cancelled, which takes the request out of the queue.
+        """
+        self.check_cancelled()
+        self._update(wait_state=(position, eta))
+
+    def note(self, text: str) -> None:
+        with self._cond:
+            self.notes.append(text)
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, version: int, timeout: float) -> int:
+        """
+        Block until the job changes from the given version, finishes or the
+        timeout passes. Returns the current version.
+        """
+        with self._cond:
+            if self.version == version and not self.done:
+                self._cond.wait(timeout)
+            return self.version
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Consistent view of the job for rendering.
+        """
+        with self._cond:
+            return {
+                "status": self.status,
+                "text": "".join(self.chunks),
+                "progress": self.progress,
+                "wait_state": self.wait_state,
+                "notes": list(self.notes),
+                "version": self.version,
+            }
+
+
+def stream_to_job(job: Job, chunks: Iterator[str]) -> str:
+    """
+    Store streamed chunks on the job as they arrive and return the full text.
+    The stream is closed if the job is cancelled.
+    """
+    parts = []
+    try:
+        for chunk in chunks:
+            job.append(chunk)
+            parts.append(chunk)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return "".join(parts)
+
+
+class JobManager:
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_active_per_owner: int = DEFAULT_MAX_ACTIVE_PER_OWNER,
+        retention_seconds: float = DEFAULT_RETENTION_SECONDS
+    ):
+        """
+        Runs analyses on a bounded worker pool, outside any Streamlit script run,
+        so a rerun, reload or disconnect does not throw away a generation.
+        Jobs are identified by ID and looked up by their owner (session ID).
+        """
+        self.max_active_per_owner = max_active_per_owner
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs: Dict[str, Job] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        owner: str,
+        key: str,
+        work: Callable[[Job], str],
+        meta: Optional[Dict[str, Any]] = None
+    ) -> Job:
+        """
+        Queue work(job) and return the job. An identical request (same key) that
+        the owner already has in flight is returned instead of starting another.
+        Raises JobLimitError if the owner is at the cap of active jobs.
+        """
+        with self._lock:
+            self._prune()
+            active = [job for job in self._jobs.values() if job.owner == owner and not job.done]
+            for job in active:
+                if job.key == key and not job.cancelled:
+                    REGISTRY.inc("jobs_total", result="deduplicated")
+                    return job
+            if len(active) >= self.max_active_per_owner:
+                raise JobLimitError(
+                    f"You already have {len(active)} analyses running. Wait for one to finish or cancel it."
+                )
+            job = Job(uuid.uuid4().hex, owner, key, meta)
+            self._jobs[job.id] = job
+            self._futures[job.id] = self._executor.submit(self._run, job, work)
+            REGISTRY.inc("jobs_total", result="submitted")
+            return job
+
+    def _run(self, job: Job, work: Callable[[Job], str]) -> None:
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job._update(status=RUNNING)
+        try:
+            result = work(job)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            self._finish(job, FAILED, error=str(e))
+        else:
+            self._finish(job, DONE, result=result)
+
+    def _finish(self, job: Job, status: str, **fields: Any) -> None:
+        job._update(status=status, finished=time.time(), **fields)
+        REGISTRY.inc("jobs_total", result=status)
+        with self._lock:
+            self._futures.pop(job.id, None)
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def jobs_for(self, owner: str) -> List[Job]:
+        """
+        The owner's jobs, oldest first.
+        """
+        with self._lock:
+            return [job for job in self._jobs.values() if job.owner == owner]
+
+    def cancel(self, job_id: str, owner: str) -> bool:
+        """
+        Cancel a job. A queued job never starts; a running one stops at its next
+        chunk or progress update. Returns False if there is no such active job.
+        """
+        job = self.get(job_id, owner)
+        if job is None or job.done:
+            return False
+        job._cancel.set()
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            self._finish(job, CANCELLED)
+        return True
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [i for i, job in self._jobs.items() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            states = [job.status for job in self._jobs.values()]
+        return {state: states.count(state) for state in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+
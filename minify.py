@@ -0,0 +1,210 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from token_accounting import estimate_tokens
+from utils import get_lexer_for_language
+
+# What each mode can do without: explanations and questions keep comments, which
+# carry intent; debugging and optimization only need the code itself
+MINIFY_POLICIES: Dict[str, Dict[str, Any]] = {
+    "Explain Code": {"drop_comments": False, "max_literal_chars": 400},
+    "Ask Question": {"drop_comments": False, "max_literal_chars": 400},
+    "Debug Code": {"drop_comments": True, "max_literal_chars": 80},
+    "Optimize Code": {"drop_comments": True, "max_literal_chars": 80},
+}
+
+# A run of at least this many lines holding only literals and punctuation is a data
+# table; its first DATA_KEEP_LINES lines are kept as a sample
+DATA_RUN_LINES = 8
+DATA_KEEP_LINES = 2
+
+# A leading comment block mentioning any of these is a license header (dropped in every mode)
+LICENSE_PATTERN = re.compile(r"copyright|licen[cs]e|spdx-license-identifier|all rights reserved", re.IGNORECASE)
+
+# "line 12", "lines 12-15", "Lines 3, 7 and 9", "L12"
+LINE_REFERENCE_PATTERN = re.compile(
+    r"\b(lines?\s+|L)(\d+(?:\s*(?:-|–|to|and|,)\s*\d+)*)\b", re.IGNORECASE
+)
+
+
+def _finish(
+    code: str,
+    lines: List[str],
+    line_map: List[int],
+    data_lines: List[bool],
+    emptied_lines: List[bool],
+    stats: Dict[str, int]
+) -> Dict[str, Any]:
+    """
+    Collapse blank-line runs and data tables, then assemble the result.
+    Lines left empty by removed comments are dropped altogether.
+    """
+    out_lines: List[str] = []
+    out_map: List[int] = []
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        if not line.strip():
+            # At most one blank line in a row, none at the start
+            if out_lines and out_lines[-1] and not emptied_lines[i]:
+                out_lines.append("")
+                out_map.append(line_map[i])
+            i += 1
+            continue
+        run = i
+        while run < len(lines) and data_lines[run]:
+            run += 1
+        if run - i >= DATA_RUN_LINES:
+            for j in range(i, i + DATA_KEEP_LINES):
+                out_lines.append(lines[j].rstrip())
+                out_map.append(line_map[j])
+            indent = line[: len(line) - len(line.lstrip())]
+            elided = run - i - DATA_KEEP_LINES
+            out_lines.append(f"{indent}... ({elided} more lines of data)")
+            out_map.append(line_map[i + DATA_KEEP_LINES])
+            stats["data_lines_elided"] += elided
+            i = run
+            continue
+        out_lines.append(line)
+        out_map.append(line_map[i])
+        i += 1
+    while out_lines and not out_lines[-1]:
+        out_lines.pop()
+        out_map.pop()
+
+    minified = "\n".join(out_lines)
+    original_tokens = estimate_tokens(code)
+    minified_tokens = estimate_tokens(minified)
+    return {
+        "code": minified,
+        "line_map": out_map,
+        "original_tokens": original_tokens,
+        "minified_tokens": minified_tokens,
+        "saved_tokens": max(0, original_tokens - minified_tokens),
+        **stats,
+    }
+
+
+def minify_code(code: str, language: str, mode: str) -> Dict[str, Any]:
+    """
+    Shrink a snippet before it is sent, using the mode's policy: drop license headers,
+    blank-line runs and data tables; for some modes also comments, docstrings and long
+    literals (replaced by placeholders). Returns the minified code, line_map (the
+    original line number of each minified line) and token counts before and after.
+    """
+    policy = MINIFY_POLICIES.get(mode, {"drop_comments": False, "max_literal_chars": 0})
+    stats = {"comments_removed": 0, "literals_elided": 0, "data_lines_elided": 0}
+    lexer = get_lexer_for_language(language)
+    if lexer is None:
+        lines = code.splitlines()
+        flags = [False] * len(lines)
+        return _finish(code, lines, list(range(1, len(lines) + 1)), flags, flags, stats)
+
+    from pygments.token import Comment, Literal, Operator, Punctuation, String, Text
+
+    tokens = list(lexer.get_tokens(code))
+    if not code.endswith("\n") and tokens and tokens[-1][1].endswith("\n"):
+        # The lexer appends a newline
+        tokens[-1] = (tokens[-1][0], tokens[-1][1][:-1])
+
+    # License header: the leading comments, if they mention a license
+    header_end = 0
+    while header_end < len(tokens) and (tokens[header_end][0] in Comment or not tokens[header_end][1].strip()):
+        header_end += 1
+    header = "".join(value for token_type, value in tokens[:header_end] if token_type in Comment)
+    if not LICENSE_PATTERN.search(header):
+        header_end = 0
+
+    lines: List[str] = []
+    line_map: List[int] = []
+    data_lines: List[bool] = []
+    emptied_lines: List[bool] = []
+    current: List[str] = []
+    current_start: Optional[int] = None
+    has_literal = False
+    only_data = True
+    emptied = False
+    original_line = 1
+
+    def emit(text: str, count_lines: bool = True) -> None:
+        nonlocal current, current_start, has_literal, only_data, emptied, original_line
+        for n, piece in enumerate(text.split("\n")):
+            if n:
+                lines.append("".join(current))
+                line_map.append(current_start or original_line)
+                data_lines.append(has_literal and only_data)
+                emptied_lines.append(emptied)
+                current, current_start, has_literal, only_data, emptied = [], None, False, True, False
+                if count_lines:
+                    original_line += 1
+            if piece:
+                current.append(piece)
+                if current_start is None and piece.strip():
+                    current_start = original_line
+
+    i = 0
+    while i < len(tokens):
+        token_type, value = tokens[i]
+        dropped = (i < header_end and token_type in Comment) or (
+            policy["drop_comments"] and (token_type in Comment or token_type in String.Doc)
+        )
+        if dropped:
+            stats["comments_removed"] += 1
+            emptied = True
+            # Keep the line break a comment ends with or spans, not its lines
+            if "\n" in value:
+                emit("\n", count_lines=False)
+                # The rest of the comment's last line is left over too
+                emptied = not value.endswith("\n")
+            original_line += value.count("\n")
+            i += 1
+            continue
+
+        if token_type in String and token_type not in String.Doc:
+            # Quotes, prefixes and contents are separate tokens; treat the run as one literal
+            end = i
+            while end < len(tokens) and tokens[end][0] in String and tokens[end][0] not in String.Doc:
+                end += 1
+            literal = "".join(piece for _, piece in tokens[i:end])
+            limit = policy["max_literal_chars"]
+            # Interpolated strings (f-strings, template literals) are split into
+            # several runs; eliding one would leave the others unbalanced
+            interpolated = any(token_type in String.Interpol for token_type, _ in tokens[i:end])
+            if limit and len(literal) > limit and not interpolated:
+                stats["literals_elided"] += 1
+                emit(f'"<{len(literal):,} chars elided>"')
+                original_line += literal.count("\n")
+            else:
+                emit(literal)
+            has_literal = True
+            i = end
+            continue
+
+        if token_type in Literal and token_type not in String.Doc:
+            has_literal = True
+        elif value.strip() and not (token_type in Punctuation or token_type in Operator or token_type in Text):
+            only_data = False
+        emit(value)
+        i += 1
+    lines.append("".join(current))
+    line_map.append(current_start or original_line)
+    data_lines.append(has_literal and only_data)
+    emptied_lines.append(emptied)
+    return _finish(code, lines, line_map, data_lines, emptied_lines, stats)
+
+
+def remap_line_references(text: str, line_map: List[int]) -> str:
+    """
+    Rewrite line numbers in an answer about minified code ("line 12", "lines 3-5")
+    to the matching lines of the original code.
+    """
+    if all(original == n for n, original in enumerate(line_map, 1)):
+        return text
+
+    def remap_numbers(match: re.Match) -> str:
+        def remap(number: re.Match) -> str:
+            n = int(number.group())
+            return str(line_map[n - 1]) if 1 <= n <= len(line_map) else number.group()
+        return match.group(1) + re.sub(r"\d+", remap, match.group(2))
+
+    return LINE_REFERENCE_PATTERN.sub(remap_numbers, text)
@@ -0,0 +1,275 @@
+import hashlib
+import random
+import threading
+import zlib
+from array import array
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cache import DEFAULT_MAX_ENTRIES as CACHE_MAX_ENTRIES
+from utils import get_lexer_for_language
+
+# Modes whose prompt depends only on the code (plus mode settings), so an analysis
+# of a near-identical snippet answers the same request. Debugging and optimization
+# are left out: literals are ignored when matching, and an off-by-one index or a
+# changed return value is exactly what those modes must notice.
+NEAR_DUPLICATE_MODES = ("Explain Code",)
+
+DEFAULT_THRESHOLD = 0.9
+# Entries point at response cache keys, so there is no use indexing more than the cache holds
+DEFAULT_MAX_ENTRIES = CACHE_MAX_ENTRIES
+
+# MinHash signature of NUM_PERM values, split into BANDS bands of ROWS values for LSH.
+# Snippets become candidates when all values of any one band agree, which is likely
+# above about (1 / BANDS) ** (1 / ROWS) = 0.77 similarity.
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_TOKENS = 5
+# Snippets shorter than this (in canonical tokens) are too generic to match
+MIN_TOKENS = 20
+# Upper bound on candidates compared per lookup
+MAX_CANDIDATES = 64
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)
+]
+
+# Cache keys are sha256 hex digests (cache.make_cache_key), stored as raw bytes
+KEY_BYTES = 32
+
+# Scope of an entry whose cache key turned out to be gone; never matches a lookup
+_REMOVED = 0
+
+
+def canonical_tokens(code: str, language: str) -> Optional[List[str]]:
+    """
+    Pygments token stream with comments, docstrings and whitespace removed,
+    identifiers numbered by first use (ID1, ID2, ...) and literals replaced by
+    STR or NUM, so renames, comments and sample data do not count as changes.
+    None if the language has no lexer.
+    """
+    lexer = get_lexer_for_language(language)
+    if lexer is None:
+        return None
+    from pygments.token import Comment, Literal, Name, String
+
+    names: Dict[str, str] = {}
+    tokens: List[str] = []
+    for token_type, value in lexer.get_tokens(code):
+        if token_type in Comment or token_type in String.Doc or not value.strip():
+            continue
+        if token_type in String:
+            # Quotes, prefixes and escapes are separate tokens; keep one per literal
+            if tokens and tokens[-1] == "STR":
+                continue
+            tokens.append("STR")
+        elif token_type in Literal:
+            tokens.append("NUM")
+        elif token_type in Name and token_type not in Name.Builtin:
+            if value not in names:
+                names[value] = f"ID{len(names) + 1}"
+            tokens.append(names[value])
+        else:
+            tokens.append(value.strip())
+    return tokens
+
+
+@lru_cache(maxsize=32)
+def minhash_signature(code: str, language: str) -> Optional[array]:
+    """
+    MinHash signature of the snippet's canonical token shingles: NUM_PERM minimums,
+    each truncated to 32 bits (a false agreement is a 1 in 4 billion event).
+    None for unsupported languages and very short snippets.
+    The result is shared between callers; do not modify it.
+    """
+    tokens = canonical_tokens(code, language)
+    if tokens is None or len(tokens) < MIN_TOKENS:
+        return None
+    shingles = {
+        zlib.crc32("\x00".join(tokens[i:i + SHINGLE_TOKENS]).encode("utf-8"))
+        for i in range(len(tokens) - SHINGLE_TOKENS + 1)
+    }
+    return array(
+        "I", [min((a * x + b) % _MERSENNE_PRIME for x in shingles) & 0xFFFFFFFF for a, b in _PERMUTATIONS]
+    )
+
+
+def _scope_hash(scope: str) -> int:
+    return int.from_bytes(hashlib.blake2b(scope.encode("utf-8"), digest_size=8).digest(), "big") or 1
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Locality-sensitive index from MinHash signatures to response cache keys.
+        Entries live in flat arrays (under 500 bytes each); each LSH band is an
+        open-addressing hash table of entry numbers, so a lookup is a few probes
+        plus a signature comparison per candidate. Lookups only match entries
+        with the same scope (mode and its settings).
+        Entries whose cache key has been evicted are dropped when a lookup finds
+        them; when full, these go first, then the oldest live entries down to half.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._signatures = array("I")
+        self._band_keys = array("Q")
+        self._scopes = array("Q")
+        self._keys = bytearray()
+        self._tables: List[array] = []
+        self._removed = 0
+        self._lock = threading.Lock()
+        self._rebuild(1024)
+
+    def __len__(self) -> int:
+        return len(self._scopes)
+
+    @staticmethod
+    def _bands(signature: array, scope_hash: int) -> List[int]:
+        return [
+            hash((scope_hash, band, *signature[band * ROWS:(band + 1) * ROWS])) & _MASK64
+            for band in range(BANDS)
+        ]
+
+    def _rebuild(self, size: int) -> None:
+        self._tables = [array("I", bytes(4 * size)) for _ in range(BANDS)]
+        for entry in range(len(self)):
+            self._insert(entry)
+
+    def _insert(self, entry: int) -> None:
+        for band, table in enumerate(self._tables):
+            mask = len(table) - 1
+            slot = self._band_keys[entry * BANDS + band] & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = entry + 1
+
+    def _similarity(self, signature: array, entry: int) -> float:
+        stored = self._signatures[entry * NUM_PERM:(entry + 1) * NUM_PERM]
+        return sum(1 for a, b in zip(signature, stored) if a == b) / NUM_PERM
+
+    def _key(self, entry: int) -> str:
+        return self._keys[entry * KEY_BYTES:(entry + 1) * KEY_BYTES].hex()
+
+    def _candidates(self, signature: array, scope_hash: int, bands: List[int]) -> List[Tuple[float, int]]:
+        """
+        (similarity, entry) of the entries sharing a band with the signature,
+        most similar first (newest first among equally similar ones).
+        """
+        candidates = []
+        seen = set()
+        for band, band_key in enumerate(bands):
+            table = self._tables[band]
+            mask = len(table) - 1
+            slot = band_key & mask
+            while table[slot] and len(seen) < MAX_CANDIDATES:
+                entry = table[slot] - 1
+                slot = (slot + 1) & mask
+                if (
+                    entry in seen
+                    or self._band_keys[entry * BANDS + band] != band_key
+                    or self._scopes[entry] != scope_hash
+                ):
+                    continue
+                seen.add(entry)
+                candidates.append((self._similarity(signature, entry), entry))
+        candidates.sort(reverse=True)
+        return candidates
+
+    def find(
+        self,
+        signature: array,
+        scope: str,
+        is_live: Optional[Callable[[str], bool]] = None
+    ) -> Optional[Tuple[str, float]]:
+        """
+        (cache key, estimated similarity) of the most similar entry in this scope
+        at or above the threshold, or None. If is_live(key) says an entry's key is
+        gone (evicted from the cache), the entry is removed and the search goes on
+        with the next most similar one.
+        """
+        scope_hash = _scope_hash(scope)
+        bands = self._bands(signature, scope_hash)
+        with self._lock:
+            matches = [
+                (entry, self._key(entry), similarity)
+                for similarity, entry in self._candidates(signature, scope_hash, bands)
+                if similarity >= self.threshold
+            ]
+        # Checked outside the lock; the cache may have to go to disk
+        for entry, key, similarity in matches:
+            if is_live is None or is_live(key):
+                return key, similarity
+            self._remove(entry, key)
+        return None
+
+    def _remove(self, entry: int, key: str) -> None:
+        with self._lock:
+            # The entry may have moved if the index was compacted meanwhile
+            if entry < len(self) and self._scopes[entry] != _REMOVED and self._key(entry) == key:
+                self._scopes[entry] = _REMOVED
+                self._removed += 1
+
+    def add(self, signature: array, scope: str, key: str) -> None:
+        """
+        Index a cache key under a signature. An entry with an identical signature
+        in the same scope is pointed at the new key instead of adding another.
+        """
+        raw_key = bytes.fromhex(key)
+        if len(raw_key) != KEY_BYTES:
+            raise ValueError("Cache keys must be sha256 hex digests.")
+        scope_hash = _scope_hash(scope)
+        bands = self._bands(signature, scope_hash)
+        with self._lock:
+            candidates = self._candidates(signature, scope_hash, bands)
+            if candidates and candidates[0][0] == 1.0:
+                entry = candidates[0][1]
+                self._keys[entry * KEY_BYTES:(entry + 1) * KEY_BYTES] = raw_key
+                return
+
+            if len(self) >= self.max_entries:
+                live = [entry for entry in range(len(self)) if self._scopes[entry] != _REMOVED]
+                self._compact(live[max(0, len(live) - self.max_entries // 2):])
+
+            self._signatures.extend(signature)
+            self._band_keys.extend(bands)
+            self._scopes.append(scope_hash)
+            self._keys.extend(raw_key)
+            # Keep every table at most half full so probe runs stay short
+            if 2 * len(self) > len(self._tables[0]):
+                self._rebuild(2 * len(self._tables[0]))
+            else:
+                self._insert(len(self) - 1)
+
+    def _compact(self, entries: List[int]) -> None:
+        """
+        Keep only the given entries (in order) and rebuild the band tables.
+        """
+        signatures, band_keys, scopes, keys = array("I"), array("Q"), array("Q"), bytearray()
+        for entry in entries:
+            signatures.extend(self._signatures[entry * NUM_PERM:(entry + 1) * NUM_PERM])
+            band_keys.extend(self._band_keys[entry * BANDS:(entry + 1) * BANDS])
+            scopes.append(self._scopes[entry])
+            keys.extend(self._keys[entry * KEY_BYTES:(entry + 1) * KEY_BYTES])
+        self._signatures, self._band_keys, self._scopes, self._keys = signatures, band_keys, scopes, keys
+        self._removed = 0
+        self._rebuild(len(self._tables[0]))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._compact([])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = sum(
+                len(a) * a.itemsize for a in (self._signatures, self._band_keys, self._scopes, *self._tables)
+            ) + len(self._keys)
+            return {
+                "entries": len(self) - self._removed,
+                "removed": self._removed,
+                "memory_kib": round(size / 1024, 1),
+                "threshold": self.threshold,
+            }
@@ -1,8 +1,10 @@
-def get_code_explanation_prompt(code_snippet: str, programming_language: str, detail_level: str) -> str:
+from typing import List, Optional
+
+
+def get_explanation_requirements(detail_level: str) -> str:
     """
-    Generates a prompt for code explanation based on the detail level.
+    Returns the numbered explanation requirements for a detail level.
     """
-    
     requirements = ""
     if detail_level == "Basic":
         requirements = """
@@ -34,6 +36,13 @@ def get_code_explanation_prompt(code_snippet: str, programming_language: str, de
 7. **Refactoring Suggestions**: Concrete examples of how to rewrite for better quality
 8. **Testing Recommendations**: How would you unit test this code?
 """
+    return requirements
+
+def get_code_explanation_prompt(code_snippet: str, programming_language: str, detail_level: str) -> str:
+    """
+    Generates a prompt for code explanation based on the detail level.
+    """
+    requirements = get_explanation_requirements(detail_level)
 
     prompt = f"""
 You are an expert programming tutor explaining code to students. Analyze and explain the following {programming_language} code.
@@ -56,19 +65,13 @@ FORMAT YOUR RESPONSE:
 """
     return prompt
 
-def get_specific_question_prompt(code_snippet: str, programming_language: str, question: str) -> str:
+def get_question_prefix(code_snippet: str, programming_language: str) -> str:
     """
-    Generates a prompt to answer a specific question about the code.
+    Static part of the question prompt: instructions first, then the code.
+    It is identical for every question about the same snippet, so it can be cached.
     """
-    prompt = f"""
-You are an expert developer. Answer a specific question about this {programming_language} code.
-
-CODE:
-```{programming_language}
-{code_snippet}
-```
-
-QUESTION: {question}
+    prefix = f"""
+You are an expert developer. Answer questions about the {programming_language} code below.
 
 INSTRUCTIONS:
 - Provide a direct, accurate answer to the question
@@ -76,8 +79,27 @@ INSTRUCTIONS:
 - Explain the "why" behind the answer
 - If the question is irrelevant to the code, politely point that out
 - Use markdown formatting for clarity
+
+CODE:
+```{programming_language}
+{code_snippet}
+```
 """
-    return prompt
+    return prefix
+
+def get_question_suffix(question: str) -> str:
+    """
+    Variable part of the question prompt, sent after the cacheable prefix.
+    """
+    return f"""
+QUESTION: {question}
+"""
+
+def get_specific_question_prompt(code_snippet: str, programming_language: str, question: str) -> str:
+    """
+    Generates a prompt to answer a specific question about the code.
+    """
+    return get_question_prefix(code_snippet, programming_language) + get_question_suffix(question)
 
 def get_debugging_prompt(code_snippet: str, programming_language: str, error_message: str = "") -> str:
     """
@@ -155,3 +177,142 @@ INSTRUCTIONS:
 FORMAT: Use a comparison table if applicable and clear sections.
 """
     return prompt
+
+
+def get_diff_comparison_prompt(diff: str, programming_language: str, base: str = "", outline: Optional[List[str]] = None) -> str:
+    """
+    Generates a prompt to compare two versions of a snippet from version 1 (or an
+    outline of it) and a unified diff, instead of both versions in full.
+    """
+    if base:
+        context = f"""VERSION 1 (full):
+```{programming_language}
+{base}
+```"""
+    else:
+        names = ", ".join(outline or []) or "(none detected)"
+        context = f"""VERSION 1 is large, so only the changed regions are shown below with surrounding context.
+Functions and classes defined in version 1: {names}"""
+
+    prompt = f"""
+You are an expert code reviewer. Compare two versions of a {programming_language} snippet. Version 2 is version 1 with the changes in the unified diff applied (lines starting with "-" are only in version 1, lines starting with "+" are only in version 2).
+
+{context}
+
+DIFF (VERSION 1 -> VERSION 2):
+```diff
+{diff}
+```
+
+INSTRUCTIONS:
+1. **Functionality**: Do they do the same thing? Describe any behavioural differences the changes introduce.
+2. **Performance**: Which one is more efficient?
+3. **Readability**: Which one is easier to understand and maintain?
+4. **Best Practices**: Which one follows {programming_language} idioms better?
+5. **Recommendation**: Which one would you recommend using and why?
+
+FORMAT: Use a comparison table if applicable and clear sections. Refer to the versions as "Snippet 1" and "Snippet 2".
+"""
+    return prompt
+
+
+# Focus of the per-chunk (map) pass for each mode
+CHUNK_FOCUS = {
+    "Explain Code": "what this part does, its key components, and how it connects to the rest of the file",
+    "Debug Code": "bugs, logical errors, and risky edge cases in this part, with line references",
+    "Optimize Code": "performance bottlenecks and memory inefficiencies in this part, with concrete fixes",
+    "Ask Question": "anything in this part that is relevant to the question below",
+}
+
+def get_chunk_prompt(chunk: str, programming_language: str, mode: str, index: int, total: int, extra: str = "") -> str:
+    """
+    Generates a prompt for one chunk of a file too large to analyze in one request.
+    """
+    focus = CHUNK_FOCUS.get(mode, CHUNK_FOCUS["Explain Code"])
+    prompt = f"""
+You are analyzing part {index} of {total} of a large {programming_language} file. The other parts are analyzed separately and your notes will be merged into a single report.
+
+CODE (PART {index}/{total}):
+```{programming_language}
+{chunk}
+```
+
+{extra}
+
+INSTRUCTIONS:
+- Write concise notes on {focus}
+- Name the functions and classes you refer to so notes from different parts can be merged
+- Do not speculate about code that is not shown; say when something depends on other parts
+- Use markdown bullet points
+"""
+    return prompt
+
+def get_unit_prompt(unit: str, programming_language: str, mode: str, detail_level: str = "Medium", extra: str = "") -> str:
+    """
+    Generates a prompt for one function or class analyzed on its own. It does not
+    mention the unit's position, so an unchanged unit always produces the same prompt.
+    """
+    focus = CHUNK_FOCUS.get(mode, CHUNK_FOCUS["Explain Code"])
+    if mode == "Explain Code":
+        focus += f" ({detail_level.lower()} level of detail)"
+    prompt = f"""
+You are reviewing one section (a function, class or the module preamble) of a larger {programming_language} file. Each section is reviewed separately and the reviews are shown one after another.
+
+SECTION:
+```{programming_language}
+{unit}
+```
+
+{extra}
+
+INSTRUCTIONS:
+- Cover {focus}
+- Refer to code by function, class and variable names rather than line numbers
+- Do not speculate about code that is not shown; say when something depends on other sections
+- Be concise; use markdown bullet points and code blocks, with no top-level header
+"""
+    return prompt
+
+def get_merge_prompt(partial_analyses: list, programming_language: str, mode: str, detail_level: str = "Medium", extra: str = "") -> str:
+    """
+    Generates a prompt that merges per-chunk notes into one report for the given mode.
+    """
+    notes = "\n\n".join(
+        f"--- NOTES FOR PART {i} ---\n{text}" for i, text in enumerate(partial_analyses, 1)
+    )
+    if mode == "Explain Code":
+        requirements = get_explanation_requirements(detail_level)
+    elif mode == "Debug Code":
+        requirements = """
+1. **Issue Identification**: The bugs or errors found across the file
+2. **Root Cause**: Why these issues occur
+3. **Fixes**: Corrected code for each issue
+4. **Prevention**: How to avoid such mistakes in the future
+"""
+    elif mode == "Optimize Code":
+        requirements = """
+1. **Bottleneck Analysis**: The most important inefficiencies across the file
+2. **Optimizations**: Concrete optimized code for each
+3. **Comparison**: Improvements in terms of Time/Space complexity
+4. **Trade-offs**: Any trade-offs (e.g., readability vs. speed)
+"""
+    else:
+        requirements = """
+- Provide a direct, accurate answer to the question
+- Reference the specific functions or sections involved
+- Explain the "why" behind the answer
+"""
+
+    prompt = f"""
+You are an expert {programming_language} developer. A large file was analyzed in {len(partial_analyses)} parts. Merge the notes below into ONE coherent report, removing duplicates and resolving cross-part references.
+
+{notes}
+
+{extra}
+
+REPORT REQUIREMENTS:
+{requirements}
+
+FORMAT: Use markdown headers (##, ###), bullet points and code blocks. Do not mention the parts or the merging process.
+"""
+    return prompt
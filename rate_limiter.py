@@ -0,0 +1,175 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+# Free-tier style defaults; override per deployment
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+
+# How often a waiting request re-checks its position
+POLL_INTERVAL = 0.5
+
+WaitCallback = Callable[[int, float], None]
+
+
+class QueueTimeoutError(Exception):
+    """
+    Raised when a request gives up waiting in the scheduler's own queue.
+    Nothing was sent to the API, so this says nothing about the model's health.
+    """
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        Classic token bucket. Starts full.
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` tokens are available.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Ticket:
+    def __init__(self, session_id: str, tokens: int):
+        self.session_id = session_id
+        self.tokens = tokens
+
+
+class _KeyQueue:
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.sessions: Dict[str, Deque[_Ticket]] = {}
+        # Round-robin order of sessions that have waiting tickets
+        self.order: Deque[str] = deque()
+
+    def fair_order(self) -> List[_Ticket]:
+        """
+        Waiting tickets in the order they will be served: one per session per round.
+        """
+        queues = [self.sessions[s] for s in self.order]
+        ordered = []
+        for round_tickets in itertools.zip_longest(*queues):
+            ordered.extend(t for t in round_tickets if t is not None)
+        return ordered
+
+    def wait_time(self, ticket: _Ticket, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now))
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE
+    ):
+        """
+        Per-key token-bucket scheduler enforcing requests-per-minute and tokens-per-minute
+        budgets, serving sessions round-robin so one busy session cannot starve the others.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._queues: Dict[str, _KeyQueue] = {}
+        self._cond = threading.Condition()
+
+    def _queue_for(self, api_key: str) -> _KeyQueue:
+        key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = _KeyQueue(self.requests_per_minute, self.tokens_per_minute)
+            self._queues[key] = queue
+        return queue
+
+    def acquire(
+        self,
+        api_key: str,
+        session_id: str,
+        tokens: int = 1,
+        on_wait: Optional[WaitCallback] = None,
+        timeout: Optional[float] = None
+    ) -> None:
+        """
+        Block until this request may be sent.
+        on_wait(position, estimated_wait_seconds) is called while queued (position is 1-based).
+        Raises QueueTimeoutError if the request cannot be scheduled within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        ticket = _Ticket(session_id, tokens)
+
+        with self._cond:
+            queue = self._queue_for(api_key)
+            if session_id not in queue.sessions:
+                queue.sessions[session_id] = deque()
+                queue.order.append(session_id)
+            queue.sessions[session_id].append(ticket)
+
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    ordered = queue.fair_order()
+                    position = ordered.index(ticket)
+                    wait = queue.wait_time(ordered[0], now)
+                    if position == 0 and wait == 0:
+                        queue.requests.consume(1, now)
+                        queue.tokens.consume(ticket.tokens, now)
+                        self._dequeue(queue, ticket)
+                        ticket = None
+                        self._cond.notify_all()
+                        return
+                    estimate = wait + position * 60.0 / self.requests_per_minute
+                    if deadline is not None and now >= deadline:
+                        raise QueueTimeoutError("Timed out waiting for a rate limit slot.")
+                    pause = min(POLL_INTERVAL, wait) if position == 0 else POLL_INTERVAL
+                    if deadline is not None:
+                        pause = min(pause, deadline - now)
+
+                # Report outside the lock: callbacks may touch the UI
+                if on_wait is not None:
+                    on_wait(position + 1, estimate)
+                with self._cond:
+                    self._cond.wait(max(pause, 0.01))
+        finally:
+            if ticket is not None:
+                with self._cond:
+                    self._dequeue(queue, ticket)
+                    self._cond.notify_all()
+
+    def queue_length(self, api_key: str) -> int:
+        with self._cond:
+            return len(self._queue_for(api_key).fair_order())
+
+    @staticmethod
+    def _dequeue(queue: _KeyQueue, ticket: _Ticket) -> None:
+        tickets = queue.sessions[ticket.session_id]
+        tickets.remove(ticket)
+        # Served sessions move to the back of the round
+        queue.order.remove(ticket.session_id)
+        if tickets:
+            queue.order.append(ticket.session_id)
+        else:
+            del queue.sessions[ticket.session_id]
@@ -0,0 +1,268 @@
+import hashlib
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from rate_limiter import QueueTimeoutError
+from telemetry import REGISTRY
+
+T = TypeVar("T")
+
+# Error groups
+RATE_LIMIT = "rate_limit"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+EMPTY_RESPONSE = "empty_response"
+AUTH = "auth"
+SAFETY_BLOCK = "safety_block"
+INVALID_REQUEST = "invalid_request"
+# Gave up in our own scheduler queue before anything was sent
+QUEUE_TIMEOUT = "queue_timeout"
+UNKNOWN = "unknown"
+
+RETRYABLE_ERRORS = {RATE_LIMIT, SERVER_ERROR, TIMEOUT, EMPTY_RESPONSE}
+
+
+class EmptyResponseError(Exception):
+    """
+    Raised when the model returns no text.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when the circuit breaker is rejecting calls.
+    """
+
+
+class CallCancelled(Exception):
+    """
+    Raised from inside a call whose caller no longer wants it (e.g. a cancelled job).
+    Passed straight through: it is not retried and says nothing about the service.
+    """
+
+
+class RetryError(Exception):
+    def __init__(self, message: str, last_error: Optional[BaseException] = None, attempts: int = 0):
+        """
+        Raised when a call fails for good, wrapping the last underlying error.
+        """
+        super().__init__(message)
+        self.last_error = last_error
+        self.attempts = attempts
+        self.kind = classify_error(last_error) if last_error is not None else UNKNOWN
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Map an exception from the Gemini SDK (or its transport) to an error group.
+    """
+    if isinstance(error, EmptyResponseError):
+        return EMPTY_RESPONSE
+    if isinstance(error, CircuitOpenError):
+        return SERVER_ERROR
+    if isinstance(error, QueueTimeoutError):
+        return QUEUE_TIMEOUT
+
+    name = type(error).__name__
+    message = str(error).lower()
+
+    # Safety blocks surface as BlockedPromptException/StopCandidateException,
+    # or as a ValueError from response.text mentioning the finish reason
+    if "Blocked" in name or "StopCandidate" in name:
+        return SAFETY_BLOCK
+    if isinstance(error, ValueError) and ("safety" in message or "finish_reason" in message):
+        return SAFETY_BLOCK
+
+    # google.api_core exceptions carry the HTTP status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        if code == 429:
+            return RATE_LIMIT
+        if code in (401, 403):
+            return AUTH
+        if code in (408, 504):
+            return TIMEOUT
+        if code >= 500:
+            return SERVER_ERROR
+        if code == 400:
+            return AUTH if "api key" in message else INVALID_REQUEST
+        if 400 <= code < 500:
+            return INVALID_REQUEST
+
+    if isinstance(error, TimeoutError) or "Timeout" in name or "DeadlineExceeded" in name:
+        return TIMEOUT
+    if "ResourceExhausted" in name or "TooManyRequests" in name or "quota" in message:
+        return RATE_LIMIT
+    if "Unauthenticated" in name or "PermissionDenied" in name:
+        return AUTH
+    if "ServiceUnavailable" in name or "InternalServerError" in name:
+        return SERVER_ERROR
+    if isinstance(error, ConnectionError):
+        return SERVER_ERROR
+    return UNKNOWN
+
+
+def is_retryable(error: BaseException) -> bool:
+    return classify_error(error) in RETRYABLE_ERRORS
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Opens after consecutive retryable failures, then lets a single probe through
+        once the reset timeout has passed.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        """
+        Return True if a call may go through right now.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self) -> None:
+        """
+        The call never reached the service: count nothing, but free a half-open probe.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, api_key: Optional[str] = None) -> CircuitBreaker:
+    """
+    Return the process-wide breaker for a name (usually the model), creating it if needed.
+    With an API key, the breaker covers only that key's calls (it is keyed by a hash
+    of the key), so one key's exhausted quota does not block the model for the others.
+    """
+    if api_key is not None:
+        name = f"{name}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()}"
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            _breakers[name] = breaker
+        return breaker
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 20.0,
+        deadline: float = 120.0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Retry with decorrelated-jitter backoff, bounded by attempts and a per-request deadline.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.circuit_breaker = circuit_breaker
+        self.sleep = sleep
+
+    def next_delay(self, previous: float) -> float:
+        """
+        Decorrelated jitter: random between the base delay and three times the previous delay.
+        """
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous * 3)))
+
+    def call(self, fn: Callable[[float], T]) -> T:
+        """
+        Call fn(remaining_seconds) until it succeeds, fails permanently or the deadline passes.
+        """
+        started = time.monotonic()
+        delay = self.base_delay
+        last_error: Optional[BaseException] = None
+        attempts = 0
+
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+                raise _failed(RetryError("Service temporarily unavailable (circuit open).", CircuitOpenError(), attempt - 1))
+
+            attempts = attempt
+            try:
+                result = fn(remaining)
+            except CallCancelled:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.release()
+                raise
+            except Exception as e:
+                last_error = e
+                kind = classify_error(e)
+                retryable = kind in RETRYABLE_ERRORS
+                if self.circuit_breaker is not None:
+                    if kind == QUEUE_TIMEOUT:
+                        self.circuit_breaker.release()
+                    elif retryable:
+                        self.circuit_breaker.record_failure()
+                    else:
+                        self.circuit_breaker.record_success()
+                if not retryable:
+                    raise _failed(RetryError(str(e), e, attempt))
+                if attempt == self.max_attempts:
+                    break
+                delay = self.next_delay(delay)
+                if time.monotonic() - started + delay >= self.deadline:
+                    break
+                REGISTRY.inc("retries_total", kind=kind)
+                self.sleep(delay)
+                continue
+
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            return result
+
+        raise _failed(RetryError(f"Failed after {attempts} attempts: {last_error}", last_error, attempts))
+
+
+def _failed(error: RetryError) -> RetryError:
+    REGISTRY.inc("request_failures_total", kind=error.kind)
+    return error
@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from code_analyzer import DEFAULT_MODEL_NAME, CodeAnalyzer, describe_failure
+from rate_limiter import WaitCallback
+from retry import (
+    QUEUE_TIMEOUT, RATE_LIMIT, SERVER_ERROR, TIMEOUT, CircuitBreaker, CircuitOpenError, RetryError, RetryPolicy,
+    get_circuit_breaker
+)
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ModuleNotFoundError:
+        tomllib = None
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.toml")
+
+# Used when config.toml has no [router] section (or cannot be read)
+DEFAULT_ROUTER_CONFIG: Dict[str, Any] = {
+    "models": {"fast": "gemini-2.5-flash", "pro": DEFAULT_MODEL_NAME},
+    "fallback": {"fast": "pro", "pro": "fast"},
+    # Tier for small, simple snippets per mode; everything else goes to "pro"
+    "routes": {
+        "Explain Code": "fast",
+        "Ask Question": "fast",
+        "Debug Code": "fast",
+        "Optimize Code": "pro",
+        "Compare Code": "fast",
+        "Full Review": "pro",
+    },
+    "small_snippet_chars": 4000,
+    "fast_complexity": ["Simple", "Moderate"],
+    "fast_detail_levels": ["Basic", "Medium"],
+    # A model is unhealthy when its recent first-token p90 or error rate exceeds these
+    "slow_first_token_seconds": 15.0,
+    "max_error_rate": 0.3,
+    "stats_window_seconds": 300,
+    # Retries on the primary before failing over (the last model uses the full policy)
+    "failover_attempts": 2,
+    "failover_deadline_seconds": 30,
+}
+
+# Errors where another model may succeed
+FAILOVER_ERRORS = {RATE_LIMIT, SERVER_ERROR, TIMEOUT}
+
+# Samples kept per model
+STATS_WINDOW_SAMPLES = 100
+
+
+def load_router_config(path: str = DEFAULT_CONFIG_PATH) -> Dict[str, Any]:
+    """
+    Defaults overlaid with the [router] section of config.toml, if present.
+    """
+    config = {key: (dict(value) if isinstance(value, dict) else value) for key, value in DEFAULT_ROUTER_CONFIG.items()}
+    if tomllib is None or not os.path.exists(path):
+        return config
+    try:
+        with open(path, "rb") as f:
+            section = tomllib.load(f).get("router", {})
+    except (OSError, ValueError):
+        return config
+    for key, value in section.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+class ModelStats:
+    def __init__(self, window_seconds: float):
+        """
+        Rolling first-token latency and error rate for one model.
+        """
+        self.window_seconds = window_seconds
+        self._samples: Deque[Tuple[float, float, Optional[str]]] = deque(maxlen=STATS_WINDOW_SAMPLES)
+
+    def record(self, latency: float, error_kind: Optional[str] = None) -> None:
+        """
+        Add a sample; the latency of failed requests is not used.
+        """
+        self._samples.append((time.monotonic(), latency, error_kind))
+
+    def _recent(self) -> List[Tuple[float, float, Optional[str]]]:
+        cutoff = time.monotonic() - self.window_seconds
+        return [s for s in self._samples if s[0] >= cutoff]
+
+    def summary(self) -> Dict[str, Any]:
+        recent = self._recent()
+        latencies = sorted(latency for _, latency, kind in recent if kind is None)
+        errors = sum(1 for _, _, kind in recent if kind is not None)
+        return {
+            "requests": len(recent),
+            "error_rate": errors / len(recent) if recent else 0.0,
+            "p50_seconds": latencies[len(latencies) // 2] if latencies else 0.0,
+            "p90_seconds": latencies[int(len(latencies) * 0.9)] if latencies else 0.0,
+        }
+
+
+class ModelRouter:
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Picks a model tier per request and keeps rolling health stats per model,
+        so slow or failing models are demoted and requests fail over.
+        """
+        self.config = config or load_router_config()
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> ModelStats:
+        with self._lock:
+            if model not in self._stats:
+                self._stats[model] = ModelStats(self.config["stats_window_seconds"])
+            return self._stats[model]
+
+    def tier_for(self, mode: str, detail_level: str, chars: int, complexity: str) -> str:
+        config = self.config
+        tier = config["routes"].get(mode, "pro")
+        if tier != "pro" and (
+            chars > config["small_snippet_chars"]
+            or complexity not in config["fast_complexity"]
+            or (mode in ("Explain Code", "Full Review") and detail_level not in config["fast_detail_levels"])
+        ):
+            tier = "pro"
+        return tier
+
+    def healthy(self, model: str, api_key: Optional[str] = None) -> bool:
+        """
+        Shared latency and error stats, plus the key's own circuit breaker if a key is given.
+        """
+        if api_key is not None and get_circuit_breaker(model, api_key).state == "open":
+            return False
+        stats = self._model_stats(model).summary()
+        if stats["requests"] < 5:
+            return True
+        return (
+            stats["error_rate"] <= self.config["max_error_rate"]
+            and stats["p90_seconds"] <= self.config["slow_first_token_seconds"]
+        )
+
+    def choose(
+        self,
+        mode: str,
+        detail_level: str,
+        chars: int,
+        complexity: str,
+        api_key: Optional[str] = None
+    ) -> List[str]:
+        """
+        Models to try in order: the routed tier's model, then its fallback.
+        An unhealthy primary (for this API key, if given) is moved behind its fallback.
+        """
+        tier = self.tier_for(mode, detail_level, chars, complexity)
+        models = self.config["models"]
+        primary = models.get(tier, DEFAULT_MODEL_NAME)
+        fallback = models.get(self.config["fallback"].get(tier, ""), primary)
+        route = [primary] if fallback == primary else [primary, fallback]
+        if len(route) > 1 and not self.healthy(primary, api_key) and self.healthy(fallback, api_key):
+            route.reverse()
+        return route
+
+    def record(self, model: str, latency: float, error_kind: Optional[str] = None) -> None:
+        self._model_stats(model).record(latency, error_kind)
+
+    def failover_policy(self, circuit_breaker: CircuitBreaker) -> RetryPolicy:
+        """
+        Shorter retry budget for a model that has a fallback after it.
+        """
+        return RetryPolicy(
+            max_attempts=self.config["failover_attempts"],
+            deadline=self.config["failover_deadline_seconds"],
+            circuit_breaker=circuit_breaker
+        )
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            models = sorted(self._stats)
+        return [{"model": model, **self._model_stats(model).summary()} for model in models]
+
+
+def stream_routed(
+    router: ModelRouter,
+    get_analyzer: Callable[[str], CodeAnalyzer],
+    route: List[str],
+    prompt: str,
+    session_id: Optional[str] = None,
+    on_wait: Optional[WaitCallback] = None
+) -> Iterator[str]:
+    """
+    Stream from the first model in the route, failing over to the next one when a
+    model is rate limited, erroring or timing out before producing any output.
+    """
+    for i, model in enumerate(route):
+        last = i == len(route) - 1
+        analyzer = get_analyzer(model)
+        # Measured from the rate limit slot, so a long local queue does not make a
+        # model look slow; cache hits (and coalesced followers) are not recorded
+        first_token_seconds: List[float] = []
+        stream = analyzer.stream_analysis(
+            prompt,
+            retry_policy=None if last else router.failover_policy(analyzer.circuit_breaker),
+            session_id=session_id,
+            on_wait=on_wait,
+            raise_on_failure=True,
+            on_first_token=first_token_seconds.append
+        )
+        try:
+            first = next(stream, None)
+        except RetryError as e:
+            # A key's own quota, queue or open breaker says nothing about the model's health
+            if e.kind not in (RATE_LIMIT, QUEUE_TIMEOUT) and not isinstance(e.last_error, CircuitOpenError):
+                router.record(model, 0.0, e.kind)
+            if last or e.kind not in FAILOVER_ERRORS:
+                yield describe_failure(e)
+                return
+            continue
+        if first_token_seconds:
+            router.record(model, first_token_seconds[0])
+        if first is not None:
+            yield first
+        yield from stream
+        return
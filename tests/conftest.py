@@ -0,0 +1,29 @@
+import os
+import sys
+from typing import Callable, Optional
+
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_gemini import FakeGenerativeModel, FakeProfile  # noqa: E402
+from code_analyzer import CodeAnalyzer  # noqa: E402
+
+
+@pytest.fixture
+def offline_analyzer() -> Callable[..., CodeAnalyzer]:
+    """
+    Factory for real CodeAnalyzers backed by the local fake model.
+    Breakers are per model name and key, so each test passes its own model name.
+    """
+    def make(
+        model_name: str,
+        api_key: str = "test-key",
+        model: Optional[FakeGenerativeModel] = None,
+        **kwargs
+    ) -> CodeAnalyzer:
+        analyzer = CodeAnalyzer(api_key=api_key, model_name=model_name, **kwargs)
+        analyzer.model = model or FakeGenerativeModel(FakeProfile(first_token_latency=0.0, chunk_interval=0.0, chunks=2))
+        return analyzer
+    return make
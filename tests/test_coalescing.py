@@ -0,0 +1,162 @@
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+
+from benchmarks.fake_gemini import FakeGenerativeModel, FakeProfile
+from coalescing import RequestCoalescer, SharedStream
+
+
+class Source:
+    """
+    Iterator of chunks released one at a time by the test; records when it is closed.
+    """
+    def __init__(self, chunks: List[str]):
+        self.chunks = list(chunks)
+        self.release = threading.Semaphore(0)
+        self.closed = threading.Event()
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        if not self.chunks:
+            raise StopIteration
+        self.release.acquire()
+        return self.chunks.pop(0)
+
+    def close(self) -> None:
+        self.closed.set()
+
+
+def start_pump(shared: SharedStream, source: Source) -> threading.Thread:
+    thread = threading.Thread(target=shared.pump, args=(source,), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_subscribers_replay_the_stream_from_the_start():
+    shared = SharedStream()
+    shared.subscribers = 1
+    source = Source(["a", "b", "c"])
+    first = shared.subscribe()
+    pump = start_pump(shared, source)
+
+    source.release.release()
+    assert next(first) == "a"
+    assert shared.join()
+    second = shared.subscribe()
+    assert shared.subscribers == 2
+
+    source.release.release()
+    source.release.release()
+    assert list(first) == ["b", "c"]
+    assert list(second) == ["a", "b", "c"]
+    pump.join(1)
+    assert shared.done and shared.subscribers == 0
+    assert source.closed.is_set()
+
+
+def test_closing_a_subscription_releases_it():
+    shared = SharedStream()
+    shared.subscribers = 1
+    source = Source(["a", "b"])
+    first = shared.subscribe()
+    assert shared.join()
+    second = shared.subscribe()
+    start_pump(shared, source)
+
+    source.release.release()
+    assert next(first) == "a"
+    first.close()
+    assert shared.subscribers == 1
+    source.release.release()
+    assert list(second) == ["a", "b"]
+    assert shared.subscribers == 0
+
+
+def test_pump_stops_once_every_subscriber_has_left():
+    shared = SharedStream()
+    shared.subscribers = 1
+    source = Source(["a", "b", "c"])
+    subscription = shared.subscribe()
+    pump = start_pump(shared, source)
+
+    source.release.release()
+    assert next(subscription) == "a"
+    subscription.close()
+    # The pump notices at its next chunk and closes the source without draining it
+    source.release.release()
+    pump.join(1)
+    assert not pump.is_alive()
+    assert source.closed.is_set()
+    assert source.chunks == ["c"]
+    assert not shared.join()
+
+
+def test_finished_stream_cannot_be_joined():
+    shared = SharedStream()
+    shared.subscribers = 1
+    subscription = shared.subscribe()
+    shared.pump(iter(["a"]))
+    assert list(subscription) == ["a"]
+    assert not shared.join()
+
+
+def test_errors_reach_every_subscriber():
+    def failing() -> Iterator[str]:
+        yield "a"
+        raise RuntimeError("boom")
+
+    shared = SharedStream()
+    shared.subscribers = 1
+    first = shared.subscribe()
+    assert shared.join()
+    second = shared.subscribe()
+    shared.pump(failing())
+    for subscription in (first, second):
+        assert next(subscription) == "a"
+        with pytest.raises(RuntimeError):
+            next(subscription)
+
+
+def test_identical_streams_share_one_source():
+    coalescer = RequestCoalescer()
+    source = Source(["a", "b"])
+    starts = []
+
+    def factory(notify):
+        starts.append(notify)
+        return source
+
+    first = coalescer.stream("key", factory)
+    second = coalescer.stream("key", factory)
+    source.release.release()
+    source.release.release()
+    assert list(first) == ["a", "b"]
+    assert list(second) == ["a", "b"]
+    assert len(starts) == 1
+    assert (coalescer.leaders, coalescer.followers) == (1, 1)
+
+
+@pytest.mark.parametrize("keys, expected_calls", [(("key-a", "key-a"), 1), (("key-a", "key-b"), 2)])
+def test_requests_are_only_coalesced_within_one_api_key(offline_analyzer, keys, expected_calls):
+    model = FakeGenerativeModel(FakeProfile(first_token_latency=0.2, chunk_interval=0.0, chunks=3))
+    coalescer = RequestCoalescer()
+    analyzers = [
+        offline_analyzer("test-coalescing", api_key=key, model=model, coalescer=coalescer) for key in keys
+    ]
+    results = [None, None]
+
+    def run(i: int) -> None:
+        results[i] = "".join(analyzers[i].stream_analysis("same prompt"))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(5)
+    assert model.calls == expected_calls
+    assert results[0] == results[1]
@@ -0,0 +1,130 @@
+from typing import List
+
+import pytest
+
+from benchmarks.fake_gemini import FakeGenerativeModel, FakeProfile
+from chat import ChatSession
+from context_cache import ContextCacheManager, LocalContextCache
+from prompts import get_question_prefix, get_question_suffix
+from retry import INVALID_REQUEST, RetryError, classify_error
+
+CODE = "def add(a, b):\n    return a + b\n"
+
+
+class RecordingModel(FakeGenerativeModel):
+    """
+    Fake model that remembers every prompt it was sent.
+    """
+    def __init__(self):
+        super().__init__(FakeProfile(first_token_latency=0.0, chunk_interval=0.0, chunks=2, chunk_chars=16))
+        self.prompts: List[str] = []
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt, stream=stream, request_options=request_options)
+
+
+class InvalidCachedContent(Exception):
+    """
+    Shaped like google.api_core.exceptions.InvalidArgument for an expired cache.
+    """
+    code = 400
+
+
+class RecordingContextCache(LocalContextCache):
+    """
+    Local backend that remembers the turns it was asked to send after each prefix.
+    """
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def generate(self, analyzer, handle, contents, full_prompt, session_id=None, on_wait=None):
+        self.sent.append((handle, contents))
+        return super().generate(analyzer, handle, contents, full_prompt, session_id, on_wait)
+
+
+class RejectingContextCache(LocalContextCache):
+    """
+    Local backend whose caches are rejected by the server, like one that expired early.
+    """
+    def __init__(self):
+        super().__init__()
+        self.deleted: List[str] = []
+
+    def generate(self, analyzer, handle, contents, full_prompt, session_id=None, on_wait=None):
+        error = InvalidCachedContent("400 Cached content not found.")
+        raise RetryError(str(error), error, 1)
+
+    def delete(self, analyzer, handle):
+        self.deleted.append(handle)
+        super().delete(analyzer, handle)
+
+
+@pytest.fixture
+def analyzer(offline_analyzer):
+    return offline_analyzer("test-context-cache", model=RecordingModel())
+
+
+def test_prefix_is_cached_once_and_only_the_suffix_is_sent(analyzer):
+    backend = RecordingContextCache()
+    manager = ContextCacheManager(backend=backend, min_tokens=0)
+    prefix = get_question_prefix(CODE, "Python")
+
+    for question in ("What does add return?", "Can it overflow?"):
+        suffix = get_question_suffix(question)
+        assert manager.ask(analyzer, prefix, [("user", suffix)], prefix + suffix)
+        # The backend is handed only the suffix; the prefix comes from the cache
+        handle, contents = backend.sent[-1]
+        assert contents == [("user", suffix)]
+        assert backend.prefixes[handle] == prefix
+        assert analyzer.model.prompts[-1] == prefix + suffix
+
+    assert list(backend.prefixes.values()) == [prefix]
+    assert (manager.created, manager.reused) == (1, 1)
+
+
+def test_chat_sends_recent_turns_after_the_cached_prefix(analyzer):
+    backend = RecordingContextCache()
+    chat = ChatSession(CODE, "Python")
+    manager = ContextCacheManager(backend=backend, min_tokens=0)
+
+    first = "".join(chat.ask(analyzer, "What does add return?", context_cache=manager))
+    "".join(chat.ask(analyzer, "Can it overflow?", context_cache=manager))
+    _, contents = backend.sent[-1]
+    assert contents == [
+        ("user", "What does add return?"),
+        ("model", first),
+        ("user", get_question_suffix("Can it overflow?")),
+    ]
+    assert all(chat.prefix not in text for _, text in contents)
+
+
+def test_small_prefixes_are_not_cached(analyzer):
+    manager = ContextCacheManager(backend=LocalContextCache())
+    prefix = get_question_prefix(CODE, "Python")
+    assert manager.get_or_create(analyzer, prefix) is None
+    assert manager.ask(analyzer, prefix, [("user", get_question_suffix("Why?"))]) is None
+
+
+def test_rejected_cache_falls_back_to_inline(analyzer):
+    assert classify_error(InvalidCachedContent()) == INVALID_REQUEST
+    backend = RejectingContextCache()
+    manager = ContextCacheManager(backend=backend, min_tokens=0)
+    prefix = get_question_prefix(CODE, "Python")
+
+    assert manager.ask(analyzer, prefix, [("user", get_question_suffix("Why?"))]) is None
+    # The handle is forgotten and deleted, so the next question creates a fresh cache
+    assert len(backend.deleted) == 1 and not backend.prefixes
+    assert analyzer.model.prompts == []
+
+
+def test_chat_answers_inline_when_the_cache_is_rejected(analyzer):
+    manager = ContextCacheManager(backend=RejectingContextCache(), min_tokens=0)
+    chat = ChatSession(CODE, "Python")
+
+    answer = "".join(chat.ask(analyzer, "What does add return?", context_cache=manager))
+    assert answer and "Error" not in answer
+    # Sent as a chat over the full history, code prefix included
+    assert chat.prefix in analyzer.model.prompts[-1]
+    assert chat.question_count == 1
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+import rate_limiter
+from coalescing import RequestCoalescer
+from jobs import CANCELLED, Job, JobManager, stream_to_job
+from rate_limiter import RequestScheduler
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize("coalescer", [None, RequestCoalescer()], ids=["direct", "coalesced"])
+def test_cancelling_a_queued_job_takes_it_out_of_the_queue(monkeypatch, offline_analyzer, coalescer):
+    monkeypatch.setattr(rate_limiter, "POLL_INTERVAL", 0.01)
+    # One request per minute, already spent: the job's request has to queue
+    scheduler = RequestScheduler(requests_per_minute=1)
+    scheduler.acquire("test-key", "busy")
+    analyzer = offline_analyzer("test-jobs", scheduler=scheduler, coalescer=coalescer)
+    manager = JobManager(max_workers=1)
+
+    def work(job: Job) -> str:
+        return stream_to_job(job, analyzer.stream_analysis("prompt", session_id="quiet", on_wait=job.notify_wait))
+
+    job = manager.submit("owner", "key", work)
+    wait_until(lambda: job.snapshot()["wait_state"] is not None)
+    assert scheduler.queue_length("test-key") == 1
+
+    assert manager.cancel(job.id, "owner")
+    wait_until(lambda: job.done and scheduler.queue_length("test-key") == 0)
+    assert job.status == CANCELLED
+    assert analyzer.model.calls == 0
+    assert analyzer.circuit_breaker.state == "closed"
@@ -0,0 +1,71 @@
+from minify import minify_code, remap_line_references
+
+CODE = """# Copyright (c) 2024 Example Corp.
+# Licensed under the MIT License.
+
+import math
+
+
+def area(r):
+    # Area of a circle
+    return math.pi * r ** 2  # square the radius
+"""
+
+# Ten literal-only lines: eight are elided after a two-line sample
+TABLE = (
+    "PRIMES = [\n"
+    + "".join(f"    {p},\n" for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29))
+    + "]\n\n\ndef first():\n    return PRIMES[0]\n"
+)
+
+
+def test_license_header_is_dropped_in_every_mode():
+    for mode in ("Explain Code", "Debug Code"):
+        result = minify_code(CODE, "Python", mode)
+        assert "Copyright" not in result["code"] and "License" not in result["code"]
+        assert result["code"].startswith("import math")
+        assert result["line_map"][0] == 4
+
+
+def test_comments_are_kept_for_explanations():
+    result = minify_code(CODE, "Python", "Explain Code")
+    assert "# Area of a circle" in result["code"]
+    assert "# square the radius" in result["code"]
+
+
+def test_comments_are_dropped_for_debugging_and_lines_still_map_back():
+    result = minify_code(CODE, "Python", "Debug Code")
+    assert result["code"] == "import math\n\ndef area(r):\n    return math.pi * r ** 2"
+    # Two header lines and two code comments
+    assert result["comments_removed"] == 4
+    lines = CODE.splitlines()
+    for minified, original in zip(result["code"].splitlines(), result["line_map"]):
+        if minified:
+            assert lines[original - 1].startswith(minified)
+
+
+def test_data_tables_keep_a_sample():
+    result = minify_code(TABLE, "Python", "Explain Code")
+    assert result["code"].splitlines()[:4] == ["PRIMES = [", "    2,", "    3,", "    ... (8 more lines of data)"]
+    assert result["data_lines_elided"] == 8
+    assert "return PRIMES[0]" in result["code"]
+    assert result["line_map"] == [1, 2, 3, 4, 12, 13, 15, 16]
+
+
+def test_short_lists_are_not_elided():
+    code = "SIZES = [\n    1,\n    2,\n    3,\n]\n"
+    result = minify_code(code, "Python", "Explain Code")
+    assert result["code"] == code.rstrip()
+    assert result["data_lines_elided"] == 0
+
+
+def test_line_ranges_are_remapped_to_the_original_code():
+    line_map = minify_code(TABLE, "Python", "Explain Code")["line_map"]
+    answer = "The table on lines 1-5 is read on line 8 (L8)."
+    assert remap_line_references(answer, line_map) == "The table on lines 1-12 is read on line 16 (L16)."
+
+
+def test_unchanged_line_numbers_are_left_alone():
+    assert remap_line_references("See line 3.", [1, 2, 3]) == "See line 3."
+    # Out of range numbers are not guesses at original lines
+    assert remap_line_references("See line 9.", [1, 3]) == "See line 9."
@@ -0,0 +1,116 @@
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+import pytest
+
+import rate_limiter
+from rate_limiter import QueueTimeoutError, RequestScheduler
+
+KEY = "test-key"
+
+
+class FakeClock:
+    """
+    Monotonic clock that only moves when the test advances it, so budgets refill on cue.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=fake.monotonic))
+    monkeypatch.setattr(rate_limiter, "POLL_INTERVAL", 0.01)
+    return fake
+
+
+@pytest.fixture
+def scheduler(clock):
+    # One request per minute, already spent: every new request has to queue
+    scheduler = RequestScheduler(requests_per_minute=1)
+    scheduler.acquire(KEY, "busy")
+    return scheduler
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def queue_request(
+    scheduler: RequestScheduler,
+    session_id: str,
+    outcomes: List[Tuple[str, str]],
+    reports: Optional[List[Tuple[int, float]]] = None,
+    timeout: float = 600.0
+) -> threading.Thread:
+    """
+    Start a request in the background and wait until it is in the queue.
+    """
+    def on_wait(position: int, estimate: float) -> None:
+        if reports is not None:
+            reports.append((position, estimate))
+
+    def run() -> None:
+        try:
+            scheduler.acquire(KEY, session_id, on_wait=on_wait, timeout=timeout)
+            outcomes.append(("served", session_id))
+        except QueueTimeoutError:
+            outcomes.append(("timeout", session_id))
+
+    queued = scheduler.queue_length(KEY)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    wait_until(lambda: scheduler.queue_length(KEY) == queued + 1)
+    return thread
+
+
+def test_sessions_are_served_round_robin(clock, scheduler):
+    outcomes: List[Tuple[str, str]] = []
+    threads = [queue_request(scheduler, session_id, outcomes) for session_id in ("busy", "busy", "busy", "quiet")]
+    for served in range(1, len(threads) + 1):
+        clock.now += 60
+        wait_until(lambda: len(outcomes) == served)
+    for thread in threads:
+        thread.join(5)
+    # The quiet session's one request does not wait behind the busy session's backlog
+    assert [session_id for _, session_id in outcomes] == ["busy", "quiet", "busy", "busy"]
+
+
+def test_queued_requests_report_their_position_and_wait(clock, scheduler):
+    outcomes: List[Tuple[str, str]] = []
+    busy_reports: List[Tuple[int, float]] = []
+    quiet_reports: List[Tuple[int, float]] = []
+    threads = [
+        queue_request(scheduler, "busy", outcomes, busy_reports),
+        queue_request(scheduler, "busy", outcomes),
+        queue_request(scheduler, "quiet", outcomes, quiet_reports),
+    ]
+    wait_until(lambda: busy_reports and quiet_reports)
+    # Next in line waits for the budget to refill; second place also for the request ahead
+    assert busy_reports[0] == (1, 60.0)
+    assert quiet_reports[0] == (2, 120.0)
+
+    # One request gets the refilled slot and the others time out
+    clock.now += 601
+    for thread in threads:
+        thread.join(5)
+    assert len(outcomes) == len(threads)
+
+
+def test_timed_out_requests_leave_the_queue(clock, scheduler):
+    outcomes: List[Tuple[str, str]] = []
+    thread = queue_request(scheduler, "quiet", outcomes, timeout=30)
+    # Past the timeout but short of the next slot
+    clock.now += 31
+    thread.join(5)
+    assert outcomes == [("timeout", "quiet")]
+    assert scheduler.queue_length(KEY) == 0
@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks.fake_gemini import FakeGenerativeModel, FakeProfile
+from rate_limiter import RequestScheduler
+from retry import QUEUE_TIMEOUT, RATE_LIMIT, CircuitBreaker, RetryError, RetryPolicy, get_circuit_breaker
+
+
+def limited_model(rate_limit_rate: float) -> FakeGenerativeModel:
+    return FakeGenerativeModel(FakeProfile(first_token_latency=0.0, rate_limit_rate=rate_limit_rate))
+
+
+def test_breakers_are_per_api_key():
+    assert get_circuit_breaker("model", "key-a") is get_circuit_breaker("model", "key-a")
+    assert get_circuit_breaker("model", "key-a") is not get_circuit_breaker("model", "key-b")
+    assert get_circuit_breaker("model", "key-a") is not get_circuit_breaker("model")
+
+
+def test_one_keys_rate_limits_do_not_block_other_keys(offline_analyzer):
+    exhausted = offline_analyzer("test-retry", api_key="exhausted-key", model=limited_model(1.0))
+    healthy = offline_analyzer("test-retry", api_key="healthy-key", model=limited_model(0.0))
+    policy = RetryPolicy(
+        max_attempts=5, base_delay=0.0, max_delay=0.0, circuit_breaker=exhausted.circuit_breaker
+    )
+    with pytest.raises(RetryError) as failure:
+        exhausted.generate_analysis("prompt", retry_policy=policy)
+    assert failure.value.kind == RATE_LIMIT
+    assert exhausted.circuit_breaker.state == "open"
+
+    assert healthy.circuit_breaker.state == "closed"
+    assert healthy.generate_analysis("prompt")
+
+
+def test_queue_timeouts_do_not_count_against_the_breaker(offline_analyzer):
+    scheduler = RequestScheduler(requests_per_minute=1)
+    scheduler.acquire("queued-key", "other-session")
+    analyzer = offline_analyzer("test-retry", api_key="queued-key", scheduler=scheduler)
+    breaker = CircuitBreaker(failure_threshold=1)
+    policy = RetryPolicy(base_delay=0.0, max_delay=0.0, deadline=0.2, circuit_breaker=breaker)
+    with pytest.raises(RetryError) as failure:
+        analyzer.generate_analysis("prompt", retry_policy=policy)
+    assert failure.value.kind == QUEUE_TIMEOUT
+    assert failure.value.attempts == 1
+    assert breaker.state == "closed"
+    assert analyzer.model.calls == 0
@@ -0,0 +1,52 @@
+import time
+
+from cache import ResponseCache
+from rate_limiter import QueueTimeoutError
+from router import ModelRouter, stream_routed
+
+
+class SlowScheduler:
+    """
+    Scheduler whose every slot takes a while to come up, like a long local queue.
+    """
+    def __init__(self, wait: float):
+        self.wait = wait
+
+    def acquire(self, api_key, session_id, tokens=0, on_wait=None, timeout=None):
+        time.sleep(self.wait)
+
+
+class FullScheduler:
+    """
+    Scheduler whose queue is always too long to get a slot.
+    """
+    def acquire(self, api_key, session_id, tokens=0, on_wait=None, timeout=None):
+        raise QueueTimeoutError("Timed out waiting for a rate limit slot.")
+
+
+def test_first_token_latency_excludes_queue_wait(offline_analyzer):
+    router = ModelRouter()
+    analyzer = offline_analyzer("test-router-queue", scheduler=SlowScheduler(0.3))
+    assert "".join(stream_routed(router, lambda model: analyzer, ["test-router-queue"], "prompt"))
+    stats = router.summary()[0]
+    assert stats["requests"] == 1
+    assert stats["p50_seconds"] < 0.2
+
+
+def test_cache_hits_are_not_recorded(offline_analyzer):
+    router = ModelRouter()
+    analyzer = offline_analyzer("test-router-cache", cache=ResponseCache())
+    for _ in range(3):
+        assert "".join(stream_routed(router, lambda model: analyzer, ["test-router-cache"], "prompt"))
+    assert router.summary()[0]["requests"] == 1
+
+
+def test_queue_timeouts_are_not_recorded_or_failed_over(offline_analyzer):
+    router = ModelRouter()
+    queued = offline_analyzer("test-router-queued", scheduler=FullScheduler())
+    fallback = offline_analyzer("test-router-fallback")
+    analyzers = {"test-router-queued": queued, "test-router-fallback": fallback}
+    output = "".join(stream_routed(router, analyzers.get, list(analyzers), "prompt"))
+    assert "queued" in output
+    assert router.summary() == []
+    assert fallback.model.calls == 0
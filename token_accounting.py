@@ -0,0 +1,101 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+
+# Source code tokenizes denser than prose; 3.5 chars/token errs on the high side
+CHARS_PER_TOKEN = 3.5
+
+# Gemini Pro-class input window
+MAX_INPUT_TOKENS = 1_000_000
+
+# Output budget per mode (and detail level for explanations)
+OUTPUT_TOKEN_BUDGETS = {
+    ("Explain Code", "Basic"): 1024,
+    ("Explain Code", "Medium"): 3072,
+    ("Explain Code", "Advanced"): 8192,
+    "Ask Question": 2048,
+    "Debug Code": 6144,
+    "Optimize Code": 6144,
+    "Compare Code": 4096,
+    "Chunk Notes": 1536,
+}
+DEFAULT_OUTPUT_TOKENS = 8192
+
+# Number of individual requests kept for inspection
+RECENT_REQUESTS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate; no API call.
+    """
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def output_budget(mode: str, detail_level: str = "Medium") -> int:
+    """
+    max_output_tokens for a mode. Basic explanations do not need 8k tokens.
+    """
+    if (mode, detail_level) in OUTPUT_TOKEN_BUDGETS:
+        return OUTPUT_TOKEN_BUDGETS[(mode, detail_level)]
+    return OUTPUT_TOKEN_BUDGETS.get(mode, DEFAULT_OUTPUT_TOKENS)
+
+
+def preflight(prompt: str, mode: str, detail_level: str = "Medium") -> Dict[str, Any]:
+    """
+    Estimate a request before sending it.
+    """
+    input_tokens = estimate_tokens(prompt)
+    return {
+        "input_tokens": input_tokens,
+        "output_budget": output_budget(mode, detail_level),
+        "fits": input_tokens <= MAX_INPUT_TOKENS,
+    }
+
+
+class UsageRecorder:
+    def __init__(self, recent: int = RECENT_REQUESTS):
+        """
+        Aggregates actual usage_metadata from API responses, per model and output budget.
+        """
+        self._totals: Dict[Tuple[str, int], Dict[str, int]] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, max_output_tokens: int, usage: Any) -> None:
+        if usage is None:
+            return
+        entry = {
+            "time": time.time(),
+            "model": model_name,
+            "max_output_tokens": max_output_tokens,
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "total_tokens": getattr(usage, "total_token_count", 0) or 0,
+        }
+        with self._lock:
+            totals = self._totals.setdefault(
+                (model_name, max_output_tokens),
+                {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+            )
+            totals["requests"] += 1
+            for field in ("prompt_tokens", "cached_tokens", "output_tokens", "total_tokens"):
+                totals[field] += entry[field]
+            self._recent.append(entry)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        One row per (model, output budget) with request and token totals.
+        """
+        with self._lock:
+            return [
+                {"model": model, "max_output_tokens": budget, **totals}
+                for (model, budget), totals in sorted(self._totals.items())
+            ]
+
+    def recent(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent)
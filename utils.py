@@ -1,7 +1,8 @@
+import hashlib
 import re
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any
-from pygments.lexers import guess_lexer, get_lexer_by_name, ClassNotFound
-from pygments.util import ClassNotFound as PygmentsClassNotFound
 
 # Supported languages for manual selection
 SUPPORTED_LANGUAGES = [
@@ -11,6 +12,34 @@ SUPPORTED_LANGUAGES = [
     "Objective-C", "Assembly", "MATLAB", "Fortran", "COBOL"
 ]
 
+# Pygments lexer aliases for each supported language
+PYGMENTS_ALIASES = {
+    "Python": "python", "JavaScript": "javascript", "TypeScript": "typescript",
+    "Java": "java", "C++": "cpp", "C": "c", "C#": "csharp", "Go": "go", "Rust": "rust",
+    "Swift": "swift", "Kotlin": "kotlin", "PHP": "php", "Ruby": "ruby", "SQL": "sql",
+    "HTML": "html", "CSS": "css", "Shell": "bash", "PowerShell": "powershell", "R": "r",
+    "Dart": "dart", "Scala": "scala", "Haskell": "haskell", "Lua": "lua", "Perl": "perl",
+    "Objective-C": "objective-c", "Assembly": "nasm", "MATLAB": "matlab",
+    "Fortran": "fortran", "COBOL": "cobol"
+}
+
+# Input size limits: a single request, and the chunked pipeline for large files
+MAX_CODE_CHARS = 50000
+MAX_CHUNKED_CODE_CHARS = 1000000
+
+# File extensions mapped to display names, used when a filename is known
+EXTENSION_LANGUAGES = {
+    ".py": "Python", ".js": "JavaScript", ".mjs": "JavaScript", ".jsx": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript", ".java": "Java", ".cpp": "C++",
+    ".cc": "C++", ".cxx": "C++", ".hpp": "C++", ".c": "C", ".h": "C", ".cs": "C#",
+    ".go": "Go", ".rs": "Rust", ".swift": "Swift", ".kt": "Kotlin", ".kts": "Kotlin",
+    ".php": "PHP", ".rb": "Ruby", ".sql": "SQL", ".html": "HTML", ".htm": "HTML",
+    ".css": "CSS", ".sh": "Shell", ".bash": "Shell", ".ps1": "PowerShell", ".r": "R",
+    ".dart": "Dart", ".scala": "Scala", ".hs": "Haskell", ".lua": "Lua", ".pl": "Perl",
+    ".pm": "Perl", ".m": "Objective-C", ".mm": "Objective-C", ".asm": "Assembly",
+    ".s": "Assembly", ".f90": "Fortran", ".f": "Fortran", ".cob": "COBOL", ".cbl": "COBOL"
+}
+
 # Sample codes for testing
 SAMPLE_CODES = {
     "Python - Bubble Sort": """def bubble_sort(arr):
@@ -69,33 +98,222 @@ for i in range(10):
     print(f"Fibonacci({i}) = {fibonacci(i)}")"""
 }
 
-def detect_language(code: str) -> str:
+# Language detection tuning
+DETECTION_SAMPLE_CHARS = 4000
+DETECTION_CACHE_SIZE = 512
+MIN_KEYWORD_SCORE = 3
+
+SHEBANG_LANGUAGES = {
+    "python": "Python", "node": "JavaScript", "deno": "TypeScript", "bash": "Shell",
+    "sh": "Shell", "zsh": "Shell", "ksh": "Shell", "ruby": "Ruby", "perl": "Perl",
+    "php": "PHP", "pwsh": "PowerShell", "Rscript": "R", "lua": "Lua"
+}
+
+# (pattern, weight) signatures per language, compiled once at import
+_KEYWORD_SIGNATURES = {
+    "Python": [
+        (r"^\s*def \w+\(.*\)\s*(->\s*[\w\[\], .]+)?:\s*$", 3), (r"^\s*from [\w.]+ import ", 3),
+        (r"^\s*import [\w.]+\s*$", 1), (r"^\s*elif .*:\s*$", 3), (r"\bself\.", 1),
+        (r"^\s*class \w+(\(.*\))?:\s*$", 3), (r"\bprint\(f?[\"']", 1), (r'^\s*"""', 2),
+        (r"^\s*(for|while|if) .*:\s*$", 2), (r"\bNone\b|\bTrue\b|\bFalse\b", 1)
+    ],
+    "JavaScript": [
+        (r"\bfunction\s*\w*\s*\(", 2), (r"\b(const|let|var) \w+\s*=", 2), (r"=>", 1),
+        (r"\bconsole\.(log|error|warn)\(", 3), (r"\brequire\(['\"]", 2), (r"\bawait\b", 1),
+        (r"\bdocument\.|\bwindow\.", 2), (r"===|!==", 2), (r"\bmodule\.exports\b", 3)
+    ],
+    "TypeScript": [
+        (r":\s*(string|number|boolean|void|any|unknown)\b", 3), (r"^\s*(export )?interface \w+", 3),
+        (r"^\s*(export )?type \w+\s*=", 3), (r"\b(private|public|readonly) \w+\s*:", 2),
+        (r"<\w+(\[\])?>\(", 1), (r"\bas (string|number|const)\b", 2)
+    ],
+    "Java": [
+        (r"\bpublic static void main\s*\(", 4), (r"\bSystem\.out\.print", 4), (r"^\s*import java\.", 4),
+        (r"\b(public|private|protected) (static )?(final )?\w+(<.*>)? \w+\s*\(", 2),
+        (r"^\s*package [\w.]+;", 3), (r"@Override\b", 3), (r"\bnew \w+(<.*>)?\(", 1)
+    ],
+    "C#": [
+        (r"^\s*using System", 4), (r"\bConsole\.Write(Line)?\(", 4), (r"^\s*namespace [\w.]+", 2),
+        (r"\b(public|private) (async )?\w+ \w+\s*\{\s*get;", 4), (r"\bvar \w+ = new\b", 2)
+    ],
+    "C++": [
+        (r"#include\s*<(iostream|vector|string|map|memory|algorithm)>", 4), (r"\bstd::", 4),
+        (r"\bcout\s*<<|\bcin\s*>>", 4), (r"\btemplate\s*<", 3), (r"\bnullptr\b", 3),
+        (r"^\s*using namespace \w+;", 4), (r"\bclass \w+\s*(:\s*public \w+)?\s*\{", 1)
+    ],
+    "C": [
+        (r"#include\s*<(stdio|stdlib|string|math|unistd)\.h>", 4), (r"\bprintf\s*\(", 2),
+        (r"\bmalloc\s*\(|\bfree\s*\(", 2), (r"\bint main\s*\(", 2), (r"\bstruct \w+\s*\{", 1)
+    ],
+    "Go": [
+        (r"^\s*package \w+\s*$", 3), (r"^\s*func (\(\w+ \*?\w+\) )?\w+\(", 3), (r"\bfmt\.\w+\(", 4),
+        (r":=", 2), (r"^\s*import \($", 2), (r"\berr != nil\b", 4)
+    ],
+    "Rust": [
+        (r"^\s*(pub )?fn \w+", 3), (r"\blet mut\b", 4), (r"\b(println|vec|format)!", 4),
+        (r"^\s*impl\b", 3), (r"^\s*use \w+::", 3), (r"&mut\b|&self\b", 3)
+    ],
+    "Swift": [
+        (r"^\s*import (UIKit|Foundation|SwiftUI)", 4), (r"\bguard let\b|\bif let\b", 4),
+        (r"^\s*func \w+\(.*\)( -> \w+)?\s*\{", 2), (r"\bvar \w+\s*:\s*\w+", 1)
+    ],
+    "Kotlin": [
+        (r"^\s*fun \w+\(", 4), (r"\bval \w+\s*(:\s*\w+)?\s*=", 2), (r"\bprintln\(", 1),
+        (r"^\s*data class\b", 4), (r"\bwhen\s*\(.*\)\s*\{", 2)
+    ],
+    "PHP": [
+        (r"<\?php", 6), (r"\$\w+\s*=", 2), (r"\becho\b", 1), (r"->\w+\(", 1), (r"\bfunction \w+\(\$", 3)
+    ],
+    "Ruby": [
+        (r"^\s*end\s*$", 2), (r"^\s*def \w+[?!]?(\(.*\))?\s*$", 2), (r"\bputs\b", 3),
+        (r"^\s*require ['\"]", 2), (r"\.each do \|", 4), (r"^\s*module \w+\s*$", 2), (r"@\w+\s*=", 1)
+    ],
+    "SQL": [
+        (r"(?i)\bSELECT\b[\s\S]*?\bFROM\b", 4), (r"(?i)\bCREATE TABLE\b", 5),
+        (r"(?i)\bINSERT INTO\b", 5), (r"(?i)\bUPDATE \w+ SET\b", 5), (r"(?i)\bWHERE\b", 1)
+    ],
+    "HTML": [
+        (r"(?i)<!DOCTYPE html", 6), (r"(?i)<html\b", 4), (r"(?i)</?(div|span|body|head|p|a)\b[^>]*>", 2)
+    ],
+    "CSS": [
+        (r"^\s*[.#]?[\w-]+(\s*[,>]\s*[.#]?[\w-]+)*\s*\{\s*$", 2),
+        (r"^\s*[\w-]+\s*:\s*[^;{}]+;\s*$", 1), (r"@media\b", 4)
+    ],
+    "Shell": [
+        (r"^\s*echo\b", 2), (r"^\s*(fi|done|esac)\s*$", 4), (r"\bthen\s*$", 2), (r"\$\{\w+\}", 2)
+    ],
+    "PowerShell": [
+        (r"\b(Get|Set|New|Write)-\w+", 4), (r"\$\w+\s*=", 1), (r"-eq\b|-ne\b", 3)
+    ],
+}
+
+_COMPILED_SIGNATURES = {
+    language: [(re.compile(pattern, re.MULTILINE), weight) for pattern, weight in signatures]
+    for language, signatures in _KEYWORD_SIGNATURES.items()
+}
+
+# Lexer classes for the supported languages only, resolved on first use
+_shortlist: Optional[List[Any]] = None
+_detection_cache: "OrderedDict[str, str]" = OrderedDict()
+_detection_lock = threading.Lock()
+
+def _shortlisted_lexers() -> List[Any]:
+    global _shortlist
+    if _shortlist is None:
+        # Pygments is imported on first use to keep app start-up light
+        from pygments.lexers import get_lexer_by_name
+        from pygments.util import ClassNotFound as PygmentsClassNotFound
+
+        lexers = []
+        for language, alias in PYGMENTS_ALIASES.items():
+            try:
+                lexers.append((language, type(get_lexer_by_name(alias))))
+            except PygmentsClassNotFound:
+                continue
+        _shortlist = lexers
+    return _shortlist
+
+def _detect_from_shebang(sample: str) -> Optional[str]:
+    if not sample.startswith("#!"):
+        return None
+    first_line = sample.split("\n", 1)[0]
+    parts = first_line[2:].replace("/", " ").split()
+    for part in reversed(parts):
+        name = part.rstrip("0123456789.")
+        if name in SHEBANG_LANGUAGES:
+            return SHEBANG_LANGUAGES[name]
+    return None
+
+def _keyword_scores(sample: str) -> Dict[str, int]:
+    scores = {}
+    for language, signatures in _COMPILED_SIGNATURES.items():
+        score = sum(weight for pattern, weight in signatures if pattern.search(sample))
+        if score:
+            scores[language] = score
+    # TypeScript is a superset of JavaScript: only prefer it on TS-specific evidence
+    if "TypeScript" in scores:
+        scores["TypeScript"] += scores.get("JavaScript", 0)
+    return scores
+
+def _detect_uncached(sample: str) -> str:
+    language = _detect_from_shebang(sample)
+    if language:
+        return language
+
+    scores = _keyword_scores(sample)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if ranked and ranked[0][1] >= MIN_KEYWORD_SCORE:
+        return ranked[0][0]
+
+    # Slow path: ask only the shortlisted Pygments lexers
+    best_language, best_score = None, 0.0
+    for language, lexer_cls in _shortlisted_lexers():
+        try:
+            score = lexer_cls.analyse_text(sample)
+        except Exception:
+            continue
+        if score > best_score:
+            best_language, best_score = language, score
+    if best_language:
+        return best_language
+    if ranked:
+        return ranked[0][0]
+    return "Unknown"
+
+def detect_language(code: str, filename: Optional[str] = None) -> str:
     """
-    Detect the programming language using Pygments.
+    Detect the programming language: file extension, then shebang and keyword
+    signatures, then the Pygments lexers for supported languages only.
+    Only a bounded prefix is inspected and results are memoized by content hash.
     """
     if not code.strip():
         return "Unknown"
-    
+    if filename:
+        language = language_from_filename(filename)
+        if language:
+            return language
+
+    # Slice before stripping so huge pastes are never copied in full
+    sample = code[:DETECTION_SAMPLE_CHARS * 2].lstrip()[:DETECTION_SAMPLE_CHARS]
+    key = hashlib.sha1(sample.encode("utf-8", "replace")).hexdigest()
+    with _detection_lock:
+        if key in _detection_cache:
+            _detection_cache.move_to_end(key)
+            return _detection_cache[key]
+
+    language = _detect_uncached(sample)
+    with _detection_lock:
+        _detection_cache[key] = language
+        if len(_detection_cache) > DETECTION_CACHE_SIZE:
+            _detection_cache.popitem(last=False)
+    return language
+
+def language_from_filename(filename: str) -> Optional[str]:
+    """
+    Map a filename to a supported language by its extension.
+    """
+    dot = filename.rfind(".")
+    if dot == -1:
+        return None
+    return EXTENSION_LANGUAGES.get(filename[dot:].lower())
+
+def get_lexer_for_language(language: str) -> Optional[Any]:
+    """
+    Return a Pygments lexer for a supported display name, or None.
+    """
+    alias = PYGMENTS_ALIASES.get(language)
+    if alias is None:
+        return None
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound as PygmentsClassNotFound
     try:
-        lexer = guess_lexer(code)
-        # Map pygments lexer names to our supported display names if possible
-        name = lexer.name
-        if "Python" in name: return "Python"
-        if "JavaScript" in name: return "JavaScript"
-        if "TypeScript" in name: return "TypeScript"
-        if "C++" in name: return "C++"
-        if "Java" in name: return "Java"
-        if "C#" in name: return "C#"
-        if "Go" in name: return "Go"
-        if "Rust" in name: return "Rust"
-        if "SQL" in name: return "SQL"
-        if "HTML" in name: return "HTML"
-        if "CSS" in name: return "CSS"
-        return name
-    except Exception:
-        return "Unknown"
+        # Keep leading/trailing newlines so token positions match line numbers;
+        # startinline lets the PHP lexer handle snippets without an opening tag
+        return get_lexer_by_name(alias, stripnl=False, startinline=True)
+    except PygmentsClassNotFound:
+        return None
 
-def validate_code(code: str) -> tuple[bool, str]:
+def validate_code(code: str, max_chars: int = MAX_CODE_CHARS) -> tuple[bool, str]:
     """
     Validate input code snippet.
     """
@@ -104,27 +322,116 @@ def validate_code(code: str) -> tuple[bool, str]:
         return False, "Code snippet cannot be empty."
     if len(code) < 10:
         return False, "Code snippet is too short to analyze (minimum 10 characters)."
-    if len(code) > 50000:
-        return False, "Code snippet is too long (maximum 50,000 characters)."
+    if len(code) > max_chars:
+        return False, f"Code snippet is too long (maximum {max_chars:,} characters)."
     return True, ""
 
+# Keyword weights for the complexity score (higher score = more complex)
+COMPLEXITY_WEIGHTS = {
+    **dict.fromkeys(("if", "else", "elif", "switch", "case"), 1),
+    **dict.fromkeys(("for", "while", "foreach", "do"), 2),
+    **dict.fromkeys(("def", "function", "class", "interface", "async"), 3),
+    **dict.fromkeys(("try", "catch", "finally", "throw", "raise"), 2),
+}
+
+# Keywords whose next identifier is a function name
+FUNCTION_KEYWORDS = {"def", "function", "fn", "func", "fun"}
+
+# Words that look like `name(...) {` but are control flow, not definitions
+CONTROL_KEYWORDS = {"if", "for", "while", "switch", "catch", "foreach", "return", "elif", "with", "using", "lock"}
+
+# Words allowed between a parameter list and its body, e.g. `void f() const {`
+SIGNATURE_QUALIFIERS = {"const", "override", "noexcept", "final", "throws", "mut"}
+
+# Languages where `name(...) {` is not a function definition
+NO_BRACE_FUNCTIONS = {"Python", "Ruby", "SQL", "HTML", "CSS", "Haskell", "COBOL", "Fortran"}
+
+# One scanner for the whole metrics pass. Comments and strings are consumed whole,
+# so keywords inside them are not counted, and no pattern backtracks past a line
+# except the block comment and triple-quoted string, which stop at their terminator.
+_METRICS_TOKENS = re.compile(r"""
+    (?P<skip>\#[^\n]*|//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)
+        |\"\"\"[\s\S]*?(?:\"\"\"|\Z)|'''[\s\S]*?(?:'''|\Z)
+        |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|`[^`]*`)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<punct>::|[(){};])
+""", re.VERBOSE)
+
+def analyze_metrics(code: str, language: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Compute lines, chars, complexity score and function names in one linear scan.
+    """
+    score = 0
+    functions = set()
+    brace_functions = language not in NO_BRACE_FUNCTIONS
+
+    previous_word = ""
+    expect_name = False   # after def/function/fn/...
+    candidate = None      # identifier directly before "("
+    paren_depth = 0
+    after_close = None    # candidate whose parameter list just closed
+    last_kind = ""
+
+    for match in _METRICS_TOKENS.finditer(code):
+        kind = match.lastgroup
+        if kind == "skip":
+            continue
+        value = match.group()
+
+        if kind == "word":
+            score += COMPLEXITY_WEIGHTS.get(value, 0)
+            if expect_name:
+                functions.add(value)
+            elif value == "function" and last_kind == "::":
+                functions.add(previous_word)
+            expect_name = value in FUNCTION_KEYWORDS and last_kind != "::"
+            if value not in SIGNATURE_QUALIFIERS and previous_word != "throws":
+                after_close = None
+            if last_kind != "::":
+                previous_word = value
+            last_kind = "word"
+            continue
+
+        expect_name = False
+        if value == "(":
+            if paren_depth == 0:
+                is_name = last_kind == "word" and previous_word not in CONTROL_KEYWORDS
+                candidate = previous_word if is_name else None
+            paren_depth += 1
+            after_close = None
+        elif value == ")":
+            if paren_depth > 0:
+                paren_depth -= 1
+                if paren_depth == 0:
+                    after_close = candidate
+        elif value == "{":
+            if after_close and brace_functions:
+                functions.add(after_close)
+            after_close = None
+        else:
+            after_close = None
+        last_kind = value
+
+    return {
+        "lines": count_lines(code),
+        "chars": len(code),
+        "complexity_score": score,
+        "complexity": complexity_label(score),
+        "function_names": sorted(functions),
+    }
+
 def count_lines(code: str) -> int:
     """
     Count total lines of code.
     """
-    return len(code.splitlines())
+    if not code:
+        return 0
+    return code.count("\n") + (0 if code.endswith("\n") else 1)
 
-def estimate_complexity(code: str) -> str:
+def complexity_label(score: int) -> str:
     """
-    Estimate code complexity based on common keywords.
+    Map a complexity score to a label.
     """
-    score = 0
-    # Higher score = more complex
-    score += len(re.findall(r'\b(if|else|elif|switch|case)\b', code))
-    score += len(re.findall(r'\b(for|while|foreach|do)\b', code)) * 2
-    score += len(re.findall(r'\b(def|function|class|interface|async)\b', code)) * 3
-    score += len(re.findall(r'\b(try|catch|finally|throw|raise)\b', code)) * 2
-    
     if score < 5:
         return "Simple"
     elif score < 15:
@@ -134,31 +441,26 @@ def estimate_complexity(code: str) -> str:
     else:
         return "Very Complex"
 
-def extract_functions(code: str) -> List[str]:
+def estimate_complexity(code: str) -> str:
     """
-    Extract function/method names using basic regex.
+    Estimate code complexity based on weighted branch, loop, function and exception keywords.
     """
-    patterns = [
-        r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)',           # Python
-        r'function\s+([a-zA-Z_][a-zA-Z0-9_]*)',      # JS/PHP
-        r'([a-zA-Z_][a-zA-Z0-9_]*)\s*\(.*?\)\s*\{', # C-style
-        r'([a-zA-Z_][a-zA-Z0-9_]*)::\s*function',     # Some OOP
-    ]
-    
-    functions = []
-    for pattern in patterns:
-        matches = re.findall(pattern, code)
-        functions.extend(matches)
-    
-    return list(set(functions))
+    return analyze_metrics(code)["complexity"]
 
-def get_code_stats(code: str) -> Dict[str, Any]:
+def extract_functions(code: str, language: Optional[str] = None) -> List[str]:
+    """
+    Extract function/method names.
+    """
+    return analyze_metrics(code, language)["function_names"]
+
+def get_code_stats(code: str, language: Optional[str] = None) -> Dict[str, Any]:
     """
     Return a dictionary with various code metrics.
     """
+    metrics = analyze_metrics(code, language)
     return {
-        "lines": count_lines(code),
-        "chars": len(code),
-        "complexity": estimate_complexity(code),
-        "functions": len(extract_functions(code))
+        "lines": metrics["lines"],
+        "chars": metrics["chars"],
+        "complexity": metrics["complexity"],
+        "functions": len(metrics["function_names"])
     }